@@ -0,0 +1,29 @@
+"""
+Async counterparts of crud.py for the /async routes.
+
+Reads are native AsyncSession queries. Writes and stats reuse the sync functions in
+crud.py through AsyncSession.run_sync, so both paths share one implementation; on
+SQLite they are handed to database.write_queue and awaited without holding a thread.
+"""
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, crud, database, async_database
+
+async def run_write(fn, *args, **kwargs):
+    """Async version of database.run_write: awaits fn(db, *args, **kwargs)."""
+    if database.write_queue is not None:
+        return await asyncio.wrap_future(database.write_queue.submit(fn, *args, **kwargs))
+    async with async_database.get_async_sessionmaker()() as db:
+        return await db.run_sync(fn, *args, **kwargs)
+
+async def get_filaments(db: AsyncSession, material: str = None, low_stock: bool = False):
+    query = select(models.Filament)
+    if material:
+        query = query.where(models.Filament.material == material)
+    if low_stock:
+        query = query.where(models.Filament.remaining_weight < 100)
+    return (await db.scalars(query)).all()
+
+async def get_stats(db: AsyncSession):
+    return await db.run_sync(crud.get_stats)
@@ -0,0 +1,67 @@
+"""
+Async engine and sessions for the /async routes, on the same database as database.py.
+SQLite is driven through aiosqlite and PostgreSQL through asyncpg.
+"""
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+from . import config, database
+
+# Sync driver -> async driver for the same backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for '{backend}', set FILAMENT_ASYNC_DATABASE_URL")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+class AsyncDatabaseUnavailable(RuntimeError):
+    """No async driver for the configured database, or it is in memory; only the /async routes are affected."""
+
+# Created on first use (see get_async_sessionmaker), so a backend without an async
+# driver installed still serves every sync route
+async_engine: Optional[AsyncEngine] = None
+AsyncSessionLocal: Optional[async_sessionmaker] = None
+
+def create_engine() -> AsyncEngine:
+    if database.IS_SQLITE and database.in_memory and not config.ASYNC_DATABASE_URL:
+        # The async driver would open its own, empty in-memory database
+        raise ValueError("The /async routes can't share an in-memory database, set FILAMENT_ASYNC_DATABASE_URL")
+    url = config.ASYNC_DATABASE_URL or async_url(database.SQLALCHEMY_DATABASE_URL)
+    if database.IS_SQLITE:
+        engine = create_async_engine(url, pool_size=config.DB_POOL_SIZE, max_overflow=-1)
+        event.listen(engine.sync_engine, "connect", database.set_sqlite_pragmas)
+        return engine
+    return create_async_engine(
+        url,
+        pool_recycle=config.DB_POOL_RECYCLE_S,
+        pool_pre_ping=True,
+        **database.POOL_OPTIONS
+    )
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    global async_engine, AsyncSessionLocal
+    if AsyncSessionLocal is None:
+        try:
+            async_engine = create_engine()
+        except (ValueError, ImportError) as e:
+            raise AsyncDatabaseUnavailable(f"Async routes are unavailable: {e}") from e
+        # Objects stay readable after commit, since lazy loads can't happen outside the session
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return AsyncSessionLocal
+
+async def dispose():
+    if async_engine is not None:
+        await async_engine.dispose()
+
+# Dependency
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
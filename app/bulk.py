@@ -0,0 +1,167 @@
+"""
+Bulk imports for /filaments/bulk and /prints/bulk.
+
+The request body is read as a stream of NDJSON objects (one per line) or, when the
+Content-Type is text/csv, CSV rows with a header line. Every row is validated with
+the regular create schema; valid rows are then written in executemany batches of
+BULK_BATCH_SIZE inside a single transaction and invalid rows are reported back.
+"""
+import csv
+import json
+from typing import AsyncIterator, Callable, List, Tuple
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from . import schemas, crud, database
+
+BULK_BATCH_SIZE = 500
+
+
+async def iter_lines(request: Request) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+def ends_in_quoted_cell(line: str, in_quotes: bool) -> bool:
+    """Whether a CSV line ends inside a quoted cell, given whether it starts inside one."""
+    if '"' not in line:
+        return in_quotes
+    # Like the csv module, a quote only opens a cell at its start; "" inside one is a literal quote
+    field_start = not in_quotes
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if in_quotes:
+            if char == '"':
+                if line[i + 1:i + 2] == '"':
+                    i += 1
+                else:
+                    in_quotes = False
+        elif char == '"' and field_start:
+            in_quotes = True
+        field_start = not in_quotes and char == ","
+        i += 1
+    return in_quotes
+
+async def iter_rows(request: Request) -> AsyncIterator[Tuple[int, object]]:
+    """Yields (row number, dict) per record, or (row number, exception) for unreadable lines."""
+    is_csv = "csv" in request.headers.get("content-type", "")
+    header = None
+    row = 0
+    # Lines of the current CSV record; quoted cells may span several
+    record = []
+    in_quotes = False
+    async for line in iter_lines(request):
+        if not record and not line.strip():
+            continue
+        if is_csv:
+            record.append(line)
+            in_quotes = ends_in_quoted_cell(line, in_quotes)
+            if in_quotes:
+                continue
+            values = next(csv.reader(part + "\n" for part in record))
+            record = []
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            row += 1
+            # Empty cells fall back to the schema defaults
+            yield row, {name: value for name, value in zip(header, values) if value != ""}
+        else:
+            row += 1
+            try:
+                yield row, json.loads(line)
+            except ValueError as e:
+                yield row, e
+    if record and header is not None:
+        yield row + 1, ValueError("Unterminated quoted cell")
+
+def describe_error(e: Exception) -> str:
+    if hasattr(e, "errors"):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            for error in e.errors()
+        )
+    return str(e)
+
+def filament_from_row(data: dict) -> schemas.FilamentCreate:
+    return schemas.FilamentCreate(**data)
+
+def print_job_from_row(data: dict) -> schemas.PrintJobCreate:
+    """
+    CSV rows carry the usages in one `filaments_used` cell as "filament_id:grams"
+    pairs separated by ";" (e.g. "3:12.5;7:4"), or as a JSON list.
+    """
+    usages = data.get("filaments_used")
+    if isinstance(usages, str):
+        if usages.lstrip().startswith("["):
+            usages = json.loads(usages)
+        else:
+            pairs = [pair.split(":") for pair in usages.split(";") if pair.strip()]
+            if any(len(pair) != 2 for pair in pairs):
+                raise ValueError("filaments_used: expected 'filament_id:grams' pairs separated by ';'")
+            usages = [{"filament_id": fid.strip(), "grams_used": grams.strip()} for fid, grams in pairs]
+        data = {**data, "filaments_used": usages}
+    return schemas.PrintJobCreate(**data)
+
+async def import_rows(
+    request: Request,
+    parse_row: Callable[[dict], object],
+    insert_batch: Callable[[Session, List], None],
+    finish: Callable[[Session], None] = None
+) -> schemas.BulkImportResponse:
+    received = 0
+    errors = []
+    valid = []
+    async for row, data in iter_rows(request):
+        received += 1
+        try:
+            if isinstance(data, Exception):
+                raise data
+            if not isinstance(data, dict):
+                raise ValueError("Expected a JSON object")
+            valid.append(parse_row(data))
+        except (ValueError, TypeError) as e:
+            errors.append(schemas.BulkRowError(row=row, error=describe_error(e)))
+
+    # The whole body is validated before writing, so the write transaction (queued
+    # behind other writes on SQLite) never waits on a slow upload
+    def write(db: Session):
+        try:
+            for start in range(0, len(valid), BULK_BATCH_SIZE):
+                insert_batch(db, valid[start:start + BULK_BATCH_SIZE])
+            if finish is not None:
+                finish(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    if valid:
+        await run_in_threadpool(database.run_write, write)
+    return schemas.BulkImportResponse(received=received, created=len(valid), errors=errors)
+
+async def import_filaments(request: Request) -> schemas.BulkImportResponse:
+    return await import_rows(request, filament_from_row, crud.bulk_insert_filaments)
+
+async def import_print_jobs(request: Request, deduct: bool = True) -> schemas.BulkImportResponse:
+    # Grams are summed over the whole import so each spool gets a single UPDATE at the end,
+    # and each spool is read once for the rollups and the deductions
+    grams_by_filament = {}
+    spools = {}
+
+    def insert_batch(db: Session, print_jobs: List[schemas.PrintJobCreate]):
+        crud.bulk_insert_print_jobs(db, print_jobs, spools)
+        for job in print_jobs:
+            crud.add_usage_grams(grams_by_filament, job.filaments_used)
+
+    def finish(db: Session):
+        if deduct:
+            crud.deduct_weights(db, grams_by_filament, spools)
+
+    return await import_rows(request, print_job_from_row, insert_batch, finish)
@@ -1,11 +1,19 @@
+import base64
+import json
+import re
+import threading
+import time
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from datetime import datetime, timedelta
-from . import models, schemas
+from sqlalchemy import func, desc, case, insert, update, delete, select, or_, and_, text, literal
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from . import models, schemas, rollups
 
 def create_filament(db: Session, filament: schemas.FilamentCreate):
     db_filament = models.Filament(**filament.dict())
     db.add(db_filament)
+    db.flush()
+    record_changes(db, [db_filament.id])
     db.commit()
     db.refresh(db_filament)
     return db_filament
@@ -19,6 +27,213 @@ def get_filaments(db: Session, material: str = None, low_stock: bool = False):
         query = query.filter(models.Filament.remaining_weight < 100)
     return query.all()
 
+# Columns /filaments can sort by; ties are broken by id
+FILAMENT_SORT_COLUMNS = ("id", "brand", "material", "color_name", "remaining_weight", "price", "purchase_date")
+FILAMENT_FIELDS = tuple(column.name for column in models.Filament.__table__.columns)
+
+def encode_cursor(value, filament_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, filament_id]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        value, filament_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if sort == "purchase_date" and value is not None:
+            value = datetime.fromisoformat(value)
+        return value, int(filament_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def after_cursor(column, value, filament_id: int, descending: bool):
+    """Rows after (value, id) in ORDER BY column NULLS LAST, id, both ascending or both descending."""
+    id_column = models.Filament.id
+    beyond = (lambda a, b: a < b) if descending else (lambda a, b: a > b)
+    if value is None:
+        return and_(column.is_(None), beyond(id_column, filament_id))
+    return or_(
+        beyond(column, value),
+        and_(column == value, beyond(id_column, filament_id)),
+        column.is_(None)
+    )
+
+def list_filaments(
+    db: Session,
+    materials: Optional[List[str]] = None,
+    ids: Optional[List[int]] = None,
+    low_stock: bool = False,
+    min_weight: Optional[float] = None,
+    max_weight: Optional[float] = None,
+    brand: Optional[str] = None,
+    color: Optional[str] = None,
+    search: Optional[str] = None,
+    exclude_empty: bool = False,
+    multicolor: Optional[bool] = None,
+    sort: str = "id",
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None
+):
+    """
+    Filtered, sorted page of spools as plain dicts holding only `fields` (plus id).
+    `sort` is a FILAMENT_SORT_COLUMNS name, prefixed with "-" for descending. Paging is
+    keyset based: pass the returned cursor back to continue after the last row.
+    Returns (rows, next cursor or None, total matching rows).
+    Raises ValueError for an unknown sort column or field, or a malformed cursor.
+    """
+    Filament = models.Filament
+    descending = sort.startswith("-")
+    sort_name = sort.lstrip("-")
+    if sort_name not in FILAMENT_SORT_COLUMNS:
+        raise ValueError(f"Unknown sort column '{sort_name}'")
+    fields = list(fields or FILAMENT_FIELDS)
+    unknown = [name for name in fields if name not in FILAMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in fields:
+        fields.insert(0, "id")
+
+    conditions = []
+    if materials:
+        conditions.append(Filament.material.in_(materials))
+    if ids is not None:
+        conditions.append(Filament.id.in_(ids))
+    if low_stock:
+        conditions.append(Filament.remaining_weight < 100)
+    if min_weight is not None:
+        conditions.append(Filament.remaining_weight >= min_weight)
+    if max_weight is not None:
+        conditions.append(Filament.remaining_weight <= max_weight)
+    if exclude_empty:
+        conditions.append(Filament.remaining_weight > 0)
+    if multicolor is not None:
+        conditions.append(Filament.is_multicolor == multicolor)
+    if brand:
+        conditions.append(Filament.brand.ilike(f"%{brand}%"))
+    if color:
+        conditions.append(Filament.color_name.ilike(f"%{color}%"))
+    if search:
+        conditions.append(or_(
+            Filament.brand.ilike(f"%{search}%"),
+            Filament.color_name.ilike(f"%{search}%"),
+            Filament.material.ilike(f"%{search}%")
+        ))
+
+    total = db.scalar(select(func.count()).select_from(Filament).where(*conditions))
+
+    sort_column = getattr(Filament, sort_name)
+    query = select(*(getattr(Filament, name) for name in fields), sort_column.label("sort_value")).where(*conditions)
+    if cursor:
+        query = query.where(after_cursor(sort_column, *decode_cursor(cursor, sort_name), descending))
+    if sort_name == "id":
+        query = query.order_by(Filament.id.desc() if descending else Filament.id)
+    elif descending:
+        query = query.order_by(sort_column.desc().nulls_last(), Filament.id.desc())
+    else:
+        query = query.order_by(sort_column.asc().nulls_last(), Filament.id)
+    if limit is not None:
+        # One extra row tells whether there is a next page
+        query = query.limit(limit + 1)
+
+    rows = db.execute(query).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].sort_value, rows[-1].id)
+    return [{name: row[i] for i, name in enumerate(fields)} for row in rows], next_cursor, total
+
+def like_escape(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def abbreviation_pattern(term: str) -> str:
+    """Regex matching a word that starts with term[0] and contains the rest in order ("wht" -> White)."""
+    # Inline (?i) works in Python's re (SQLite REGEXP) and PostgreSQL alike
+    return r"(?i)(^|\s)" + r"\S*".join(re.escape(char) for char in term)
+
+def has_search_index(db: Session) -> bool:
+    if db.get_bind().dialect.name != "sqlite":
+        return False
+    return db.scalar(text("SELECT 1 FROM sqlite_master WHERE name = 'filaments_fts'")) is not None
+
+def search_filaments(db: Session, q: str, limit: int = 20):
+    """
+    Spools whose brand, color or material match every word of `q`, best first.
+    Words are matched as substrings through the filaments_fts trigram index and ranked
+    with bm25. Only when that can't be used (a word shorter than a trigram, or no
+    index) or finds nothing, words are matched as abbreviations of a word ("blk" ->
+    Black, "wht" -> White) instead, which scans the table.
+    """
+    terms = q.split()
+    if not terms:
+        return []
+    Filament = models.Filament
+    ids = []
+    # Trigrams need at least three characters per word
+    if all(len(term) >= 3 for term in terms) and has_search_index(db):
+        match = " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        ids = list(db.scalars(
+            text("SELECT rowid FROM filaments_fts WHERE filaments_fts MATCH :match ORDER BY rank LIMIT :limit"),
+            {"match": match, "limit": limit}
+        ))
+
+    if not ids:
+        haystack = Filament.brand + literal(" ") + Filament.color_name + literal(" ") + Filament.material
+        query = select(Filament.id)
+        for term in terms:
+            # The LIKE subsequence test is native and discards most rows before the regex runs
+            query = query.where(
+                haystack.ilike("%" + "%".join(like_escape(char) for char in term) + "%", escape="\\"),
+                haystack.regexp_match(abbreviation_pattern(term))
+            )
+        # Shorter descriptions match the words more closely
+        ids = list(db.scalars(query.order_by(func.length(haystack), Filament.id).limit(limit)))
+
+    by_id = {f.id: f for f in db.scalars(select(Filament).where(Filament.id.in_(ids)))} if ids else {}
+    return [by_id[filament_id] for filament_id in ids if filament_id in by_id]
+
+def record_changes(db: Session, filament_ids: List[int]):
+    """
+    Bumps the inventory version for these spools, without committing. Only each spool's
+    latest change is kept: the table stays one row per spool, and a client asking for
+    changes since any version still sees every spool changed after it.
+    The version comes from the single inventory_version row. Its UPDATE locks the row
+    until the write commits, so concurrent writers (several workers on PostgreSQL) get
+    versions in commit order and a client never skips a change committed late.
+    Call it after the spool rows have been written (flushed), so every writer takes
+    the spool rows first and the version row last.
+    """
+    if not filament_ids:
+        return
+    filament_ids = sorted(set(filament_ids))
+    version = db.scalar(
+        update(models.InventoryVersion)
+        .where(models.InventoryVersion.id == 1)
+        .values(version=models.InventoryVersion.version + 1)
+        .returning(models.InventoryVersion.version)
+    )
+    now = datetime.now()
+    db.execute(delete(models.InventoryChange).where(models.InventoryChange.filament_id.in_(filament_ids)))
+    db.execute(insert(models.InventoryChange), [
+        {"filament_id": fid, "version": version, "changed_at": now} for fid in filament_ids
+    ])
+
+def get_inventory_version(db: Session) -> int:
+    return db.scalar(select(models.InventoryVersion.version).where(models.InventoryVersion.id == 1)) or 0
+
+def get_changes(db: Session, since: int):
+    """Spools changed after version `since`, as /filaments rows, and the ids of removed ones."""
+    version = get_inventory_version(db)
+    changed_ids = list(db.scalars(
+        select(models.InventoryChange.filament_id).where(models.InventoryChange.version > since)
+    ))
+    rows = list_filaments(db, ids=changed_ids)[0] if changed_ids else []
+    found = {row["id"] for row in rows}
+    return {
+        "version": version,
+        "changed": rows,
+        "deleted": [fid for fid in changed_ids if fid not in found]
+    }
+
 def get_filament(db: Session, filament_id: int):
     return db.query(models.Filament).filter(models.Filament.id == filament_id).first()
 
@@ -32,58 +247,257 @@ def update_filament(db: Session, filament_id: int, filament_update: schemas.Fila
         setattr(db_filament, key, value)
 
     db.add(db_filament)
+    # Write the spool row before record_changes takes the inventory_version row, so every
+    # writer locks spools first and the version row last and none can deadlock another
+    db.flush()
+    record_changes(db, [filament_id])
     db.commit()
     db.refresh(db_filament)
     return db_filament
 
 def create_print_job(db: Session, print_job: schemas.PrintJobCreate):
-    # 1. Create Print Job
-    db_print_job = models.PrintJob(name=print_job.name, success=print_job.success)
-    db.add(db_print_job)
-    db.commit()
+    # The job, its usage rows and the weight deductions are one transaction,
+    # so a failure part way never leaves a job without its deductions.
+    try:
+        # 1. Create Print Job (flush only, to get its id)
+        job_date = print_job.date or datetime.now()
+        db_print_job = models.PrintJob(name=print_job.name, success=print_job.success, date=job_date)
+        db.add(db_print_job)
+        db.flush()
+
+        # 2. Usage records, inserted in one executemany
+        if print_job.filaments_used:
+            db.execute(insert(models.FilamentUsage), [
+                {
+                    "print_job_id": db_print_job.id,
+                    "filament_id": usage.filament_id,
+                    "grams_used": usage.grams_used
+                }
+                for usage in print_job.filaments_used
+            ])
+
+        # 3. Deduct weight from inventory; the spools are read once for this and the rollups
+        grams_by_filament = {}
+        add_usage_grams(grams_by_filament, print_job.filaments_used)
+        spools = load_spools(db, grams_by_filament)
+        deduct_weights(db, grams_by_filament, spools)
+
+        # 4. Stats rollups
+        rollups.record_jobs(db, [(job_date, print_job.filaments_used)], spools)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
     db.refresh(db_print_job)
+    return db_print_job
+
+def add_usage_grams(grams_by_filament: dict, usages: List[schemas.FilamentUsageBase]):
+    for usage in usages:
+        grams_by_filament[usage.filament_id] = grams_by_filament.get(usage.filament_id, 0.0) + usage.grams_used
 
-    # 2. Process usages
-    for usage in print_job.filaments_used:
-        # Create Usage Record
-        db_usage = models.FilamentUsage(
-            print_job_id=db_print_job.id,
-            filament_id=usage.filament_id,
-            grams_used=usage.grams_used
+def load_spools(db: Session, filament_ids, spools: Optional[dict] = None) -> dict:
+    """
+    The spools with these ids, as rows of the columns logging a print needs (id, brand,
+    material, color, price and initial weight), by id. Ids already in `spools` are not
+    queried again and the rows are added to it. Unknown ids are left out.
+    """
+    spools = {} if spools is None else spools
+    missing = set(filament_ids) - spools.keys()
+    if missing:
+        Filament = models.Filament
+        rows = db.execute(
+            select(Filament.id, Filament.brand, Filament.material, Filament.color_name, Filament.price, Filament.initial_weight)
+            .where(Filament.id.in_(missing))
         )
-        db.add(db_usage)
-
-        # Deduct weight from inventory
-        db_filament = get_filament(db, usage.filament_id)
-        if db_filament:
-            db_filament.remaining_weight -= usage.grams_used
-            # Ensure we don't go below zero? Optional, but good for data integrity
-            # db_filament.remaining_weight = max(0, db_filament.remaining_weight)
-            db.add(db_filament)
-    
-    db.commit()
-    return db_print_job
+        spools.update((row.id, row) for row in rows)
+    return spools
+
+def deduct_weights(db: Session, grams_by_filament: dict, spools: dict):
+    """
+    Deducts grams from each spool in a single UPDATE ... CASE statement, without committing.
+    The subtraction happens in SQL, so concurrent jobs can't overwrite each other's deductions.
+    Spool ids missing from `spools` (see load_spools) are skipped.
+    """
+    known_ids = [filament_id for filament_id in grams_by_filament if filament_id in spools]
+    if not known_ids:
+        return
+    db.execute(
+        update(models.Filament)
+        .where(models.Filament.id.in_(known_ids))
+        .values(remaining_weight=models.Filament.remaining_weight - case(
+            {filament_id: grams_by_filament[filament_id] for filament_id in known_ids},
+            value=models.Filament.id
+        ))
+        .execution_options(synchronize_session=False)
+    )
+    record_changes(db, known_ids)
+
+def bulk_insert_filaments(db: Session, filaments: List[schemas.FilamentCreate]):
+    """Inserts a batch of spools with one executemany; the caller commits."""
+    now = datetime.now()
+    rows = []
+    for filament in filaments:
+        row = filament.dict()
+        if row["purchase_date"] is None:
+            row["purchase_date"] = now
+        rows.append(row)
+    if rows:
+        filament_ids = db.scalars(
+            insert(models.Filament).returning(models.Filament.id, sort_by_parameter_order=True), rows
+        ).all()
+        record_changes(db, filament_ids)
+
+def bulk_insert_print_jobs(db: Session, print_jobs: List[schemas.PrintJobCreate], spools: dict):
+    """
+    Inserts a batch of print jobs and their usages with one executemany each and adds
+    them to the stats rollups; the caller commits and deducts the weights (see
+    deduct_weights) once for the whole import. `spools` collects the spools loaded
+    for the import (see load_spools), so each is read once.
+    """
+    if not print_jobs:
+        return
+    now = datetime.now()
+    job_dates = [job.date or now for job in print_jobs]
+    job_ids = db.scalars(
+        insert(models.PrintJob).returning(models.PrintJob.id, sort_by_parameter_order=True),
+        [{"name": job.name, "success": job.success, "date": job_date} for job, job_date in zip(print_jobs, job_dates)]
+    ).all()
+    usage_rows = [
+        {"print_job_id": job_id, "filament_id": usage.filament_id, "grams_used": usage.grams_used}
+        for job_id, job in zip(job_ids, print_jobs)
+        for usage in job.filaments_used
+    ]
+    if usage_rows:
+        db.execute(insert(models.FilamentUsage), usage_rows)
+    load_spools(db, {usage.filament_id for job in print_jobs for usage in job.filaments_used}, spools)
+    rollups.record_jobs(db, [(job_date, job.filaments_used) for job, job_date in zip(print_jobs, job_dates)], spools)
+
+def normalize_hex(color: str) -> str:
+    """'#ffffffff', 'FFFFFF' -> '#FFFFFF'; '' when it isn't a color."""
+    value = (color or "").strip().lstrip("#")[:6].upper()
+    return "#" + value if re.fullmatch(r"[0-9A-F]{6}", value) else ""
+
+def color_distance(color: str, spool_hex: str) -> float:
+    """RGB distance from `color` to the closest color of a (possibly multi-color) spool."""
+    rgb = [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+    distances = [
+        sum((a - int(spool[i:i + 2], 16)) ** 2 for a, i in zip(rgb, (1, 3, 5))) ** 0.5
+        for spool in map(normalize_hex, (spool_hex or "").split(",")) if spool
+    ]
+    return min(distances, default=float("inf"))
+
+def suggest_spools(db: Session, slots: List[schemas.FileSlot]) -> List[Optional[models.Filament]]:
+    """
+    The best spool in stock for each print file slot. Candidates have the slot's exact
+    color or its material, found through the color_hex and material indexes in one
+    query. A spool of the slot's material wins, closest color first; without a material
+    only exact colors count. Ties go to a spool with enough left for the slot, then to
+    the one with the least left, so open spools get used up.
+    """
+    colors = {normalize_hex(slot.color) for slot in slots} - {""}
+    materials = {slot.material.strip() for slot in slots} - {""}
+    if not colors and not materials:
+        return [None] * len(slots)
+    Filament = models.Filament
+    candidates = list(db.scalars(
+        select(Filament).where(
+            or_(
+                Filament.color_hex.in_(colors | {color.lower() for color in colors}),
+                Filament.material.in_(materials | {material.upper() for material in materials})
+            ),
+            Filament.remaining_weight > 0
+        )
+    ))
+
+    suggestions = []
+    for slot in slots:
+        color = normalize_hex(slot.color)
+        material = slot.material.strip().upper()
+        ranked = []
+        for filament in candidates:
+            same_material = bool(material) and (filament.material or "").upper() == material
+            distance = color_distance(color, filament.color_hex) if color else float("inf")
+            if not same_material and (material or distance > 0):
+                continue
+            ranked.append((distance, filament.remaining_weight < slot.grams, filament.remaining_weight, filament.id, filament))
+        suggestions.append(min(ranked)[-1] if ranked else None)
+    return suggestions
+
+def log_file_print(
+    db: Session,
+    parsed: dict,
+    name: str,
+    success: bool = True,
+    mapping: Optional[dict] = None,
+    dry_run: bool = False
+):
+    """
+    Matches the slots a parsed print file uses (see utils.parse_print_file) to spools,
+    taking `mapping` (slot number -> filament id) first and suggest_spools for the rest,
+    then logs the job with create_print_job unless `dry_run`. Matching and logging share
+    one transaction. Returns (slots, print job or None).
+    Raises ValueError for unknown slots or spools, or when a slot has no spool to log.
+    """
+    weights = parsed.get("estimated_weights_g") or []
+    colors = parsed.get("filament_colors") or []
+    types = parsed.get("filament_types") or []
+    mapping = mapping or {}
+    unknown_slots = sorted(slot for slot in mapping if not 1 <= slot <= len(weights))
+    if unknown_slots:
+        raise ValueError(f"The file has no slot {', '.join(map(str, unknown_slots))}")
+    known_ids = set(db.scalars(select(models.Filament.id).where(models.Filament.id.in_(mapping.values()))))
+    unknown_ids = sorted(set(mapping.values()) - known_ids)
+    if unknown_ids:
+        raise ValueError(f"Filament {', '.join(map(str, unknown_ids))} not found")
+
+    slots = [
+        schemas.FileSlot(
+            slot=number, grams=grams,
+            color=colors[number - 1] if number <= len(colors) else "",
+            material=types[number - 1] if number <= len(types) else "",
+            filament_id=mapping.get(number)
+        )
+        for number, grams in enumerate(weights, 1) if grams > 0
+    ]
+    unmapped = [slot for slot in slots if slot.filament_id is None]
+    for slot, filament in zip(unmapped, suggest_spools(db, unmapped)):
+        if filament is not None:
+            slot.filament_id = filament.id
+            slot.suggested = True
+    if dry_run:
+        return slots, None
+
+    if not slots:
+        raise ValueError("The file has no filament usage")
+    missing = [str(slot.slot) for slot in slots if slot.filament_id is None]
+    if missing:
+        raise ValueError(f"No matching spool for slot {', '.join(missing)}; pass it in the slot mapping")
+    print_job = create_print_job(db, schemas.PrintJobCreate(
+        name=name, success=success,
+        filaments_used=[schemas.FilamentUsageBase(filament_id=slot.filament_id, grams_used=slot.grams) for slot in slots]
+    ))
+    return slots, print_job
 
 def get_stats(db: Session):
+    # Read from the daily rollups (see rollups.py), so the cost grows with the number
+    # of days and colors, not with the number of usages
     now = datetime.now()
-    start_of_month = datetime(now.year, now.month, 1)
-    
+    start_of_month = date(now.year, now.month, 1)
+    Rollup = models.UsageRollup
+
     # Total plastic used this month
-    total_used = db.query(func.sum(models.FilamentUsage.grams_used))\
-        .join(models.PrintJob)\
-        .filter(models.PrintJob.date >= start_of_month)\
+    total_used = db.query(func.sum(Rollup.grams))\
+        .filter(Rollup.dimension == "total", Rollup.key == "", Rollup.day >= start_of_month)\
         .scalar() or 0.0
 
     # Most used color
-    # Group usages by filament color and sum grams
-    # We need to join FilamentUsage -> Filament
-    most_used_color_result = db.query(
-        models.Filament.color_name,
-        func.sum(models.FilamentUsage.grams_used).label('total_grams')
-    ).join(models.FilamentUsage, models.Filament.id == models.FilamentUsage.filament_id)\
-     .group_by(models.Filament.color_name)\
-     .order_by(desc('total_grams'))\
-     .first()
+    most_used_color_result = db.query(Rollup.key, func.sum(Rollup.grams).label('total_grams'))\
+        .filter(Rollup.dimension == "color")\
+        .group_by(Rollup.key)\
+        .order_by(desc('total_grams'))\
+        .first()
 
     most_used_color = most_used_color_result[0] if most_used_color_result else "N/A"
 
@@ -91,3 +505,94 @@ def get_stats(db: Session):
         "total_plastic_used_this_month": total_used,
         "most_used_color": most_used_color
     }
+
+def get_usage_timeseries(db: Session, start: date, end: date, bucket: str = "day", group_by: str = None):
+    """
+    Grams, cost and print counts per bucket (and per group_by key) between start and
+    end inclusive. Reads the daily rollups and folds the days into weeks or months.
+    """
+    Rollup = models.UsageRollup
+    rows = db.query(Rollup.day, Rollup.key, Rollup.grams, Rollup.cost, Rollup.job_count)\
+        .filter(Rollup.dimension == (group_by or "total"), Rollup.day >= start, Rollup.day <= end)\
+        .order_by(Rollup.day, Rollup.key)
+
+    points = {}
+    for day, key, grams, cost, job_count in rows:
+        point = points.setdefault((rollups.bucket_start(day, bucket), key), [0.0, 0.0, 0])
+        point[0] += grams
+        point[1] += cost
+        point[2] += job_count
+    return [
+        {"bucket": bucket_day, "key": key, "grams": grams, "cost": cost, "prints": prints}
+        for (bucket_day, key), (grams, cost, prints) in sorted(points.items())
+    ]
+
+# Cache hits are only read. Their hit counts and last_used times collect here and
+# are written in one batch (see flush_parse_hits), so a hit never waits for the writer.
+PARSE_HITS_FLUSH_S = 30
+PARSE_HITS_FLUSH_KEYS = 1000
+parse_hits = {}  # key -> [hits, last used]
+parse_hits_lock = threading.Lock()
+parse_hits_flushed = time.monotonic()
+
+def get_cached_parse(db: Session, key: str):
+    result = db.scalar(select(models.ParseCacheEntry.result).where(models.ParseCacheEntry.key == key))
+    if result is None:
+        return None
+    with parse_hits_lock:
+        hit = parse_hits.setdefault(key, [0, None])
+        hit[0] += 1
+        hit[1] = datetime.now()
+    return json.loads(result)
+
+def parse_hits_due() -> bool:
+    """Whether enough cache hits have collected, or long enough ago, to flush them."""
+    with parse_hits_lock:
+        return bool(parse_hits) and (
+            len(parse_hits) >= PARSE_HITS_FLUSH_KEYS or time.monotonic() - parse_hits_flushed >= PARSE_HITS_FLUSH_S
+        )
+
+def apply_parse_hits(db: Session):
+    """Writes the collected cache hits, without committing."""
+    global parse_hits, parse_hits_flushed
+    with parse_hits_lock:
+        hits, parse_hits = parse_hits, {}
+        parse_hits_flushed = time.monotonic()
+    Entry = models.ParseCacheEntry
+    for key, (count, last_used) in hits.items():
+        db.execute(update(Entry).where(Entry.key == key).values(hits=Entry.hits + count, last_used=last_used))
+
+def flush_parse_hits(db: Session):
+    apply_parse_hits(db)
+    db.commit()
+
+def store_parse_result(db: Session, key: str, result: dict, max_entries: int, max_bytes: int):
+    """
+    Caches a parse result, then evicts the least recently used entries beyond
+    `max_entries` or once the stored results add up to more than `max_bytes`.
+    """
+    encoded = json.dumps(result)
+    apply_parse_hits(db)
+    db.merge(models.ParseCacheEntry(
+        key=key,
+        result=encoded,
+        size_bytes=len(encoded),
+        created_at=datetime.now(),
+        last_used=datetime.now(),
+        hits=0
+    ))
+    db.flush()
+
+    Entry = models.ParseCacheEntry
+    newest_first = (desc(Entry.last_used), Entry.key)
+    ranked = select(
+        Entry.key,
+        func.row_number().over(order_by=newest_first).label("rank"),
+        func.sum(Entry.size_bytes).over(order_by=newest_first).label("total_bytes")
+    ).subquery()
+    stale_keys = list(db.scalars(
+        select(ranked.c.key).where(or_(ranked.c.rank > max_entries, ranked.c.total_bytes > max_bytes))
+    ))
+    if stale_keys:
+        db.execute(delete(Entry).where(Entry.key.in_(stale_keys)))
+    db.commit()
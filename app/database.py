@@ -1,16 +1,69 @@
-from sqlalchemy import create_engine
+import queue
+import threading
+from concurrent.futures import Future
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from . import config
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./filament_manager.db"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# Each uvicorn worker process gets its own pool
+POOL_OPTIONS = {
+    "pool_size": config.DB_POOL_SIZE,
+    "max_overflow": config.DB_MAX_OVERFLOW,
+    "pool_timeout": config.DB_POOL_TIMEOUT_S,
+}
+
+if IS_SQLITE:
+    # A sync route keeps its connection until its response has been serialised on a
+    # threadpool thread, so a bounded pool can deadlock once every thread is waiting
+    # for a connection. SQLite connections are cheap: let the pool overflow freely.
+    # Each connection to an in-memory database opens a new, empty one, so every
+    # thread (the writer thread included) shares a single connection through StaticPool.
+    in_memory = ":memory:" in SQLALCHEMY_DATABASE_URL or SQLALCHEMY_DATABASE_URL.rstrip("/") == "sqlite:"
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+        **({"poolclass": StaticPool} if in_memory else {"pool_size": config.DB_POOL_SIZE, "max_overflow": -1})
+    )
+else:
+    # pre_ping swaps out connections the server closed (restarts, idle timeouts)
+    # instead of failing the request
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_recycle=config.DB_POOL_RECYCLE_S,
+        pool_pre_ping=True,
+        **POOL_OPTIONS
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Applied to every new SQLite connection. WAL lets readers run while a write is in
+    progress, synchronous=NORMAL is durable enough under WAL and avoids an fsync per
+    commit, and busy_timeout makes a second writer wait instead of failing with
+    "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    if engine.url.database not in (None, "", ":memory:"):
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    # Negative cache_size is in KiB
+    cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE_BYTES}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+if IS_SQLITE:
+    event.listen(engine, "connect", set_sqlite_pragmas)
+
+# Dependency
 def get_db():
     db = SessionLocal()
     try:
@@ -19,3 +72,62 @@ def get_db():
         db.close()
 
 
+class WriteQueue:
+    """
+    Runs write transactions one at a time on a single background thread.
+    SQLite allows only one writer; queueing writes here means they never fight over
+    the lock, while readers keep using their own sessions concurrently.
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        self.jobs.put((future, fn, args, kwargs))
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="db-writer", daemon=True)
+                self.thread.start()
+        return future
+
+    def run(self):
+        while True:
+            future, fn, args, kwargs = self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            db = self.session_factory()
+            try:
+                future.set_result(fn(db, *args, **kwargs))
+            except BaseException as e:
+                db.rollback()
+                future.set_exception(e)
+            finally:
+                db.close()
+
+write_queue = WriteQueue(SessionLocal) if IS_SQLITE and config.DB_WRITE_QUEUE else None
+
+def run_write(fn, *args, **kwargs):
+    """
+    Calls fn(db, *args, **kwargs) with a fresh session and returns its result.
+    With SQLite the call goes through the write queue; fn must commit its own work.
+    Blocks the calling thread, so call it from sync routes or via run_in_threadpool.
+    """
+    if write_queue is not None:
+        return write_queue.submit(fn, *args, **kwargs).result()
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+def run_read(fn, *args, **kwargs):
+    """Calls fn(db, *args, **kwargs) with a fresh session, outside the write queue."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
@@ -1,54 +1,482 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, UploadFile, File, Form, Request, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import Headers
+from starlette.formparsers import MultiPartParser
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from datetime import date, datetime, timedelta
 from typing import List, Optional
-from . import models, schemas, crud, database, utils
+from . import schemas, crud, database, utils, config, bulk, async_crud, async_database, migrations
 
-# Create database tables
-models.Base.metadata.create_all(bind=database.engine)
+# Process pool for CPU-bound batch parsing, created on first use
+parse_pool: Optional[ProcessPoolExecutor] = None
 
-app = FastAPI(title="Filament Manager for Bambu Lab")
+def get_parse_pool() -> ProcessPoolExecutor:
+    global parse_pool
+    if parse_pool is None:
+        # Spawned, not forked: this process already runs the writer and event loop
+        # threads, and a forked child could inherit a lock one of them was holding
+        parse_pool = ProcessPoolExecutor(
+            max_workers=config.PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return parse_pool
 
-# Dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    migrations.run_migrations()
+    yield
+    if parse_pool is not None:
+        parse_pool.shutdown(cancel_futures=True)
+    await async_database.dispose()
+
+app = FastAPI(title="Filament Manager for Bambu Lab", lifespan=lifespan)
+# Inventory lists and stats compress well; small responses are sent as is
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Starlette spools each uploaded file, in memory up to this size and then to disk
+MultiPartParser.spool_max_size = config.UPLOAD_SPOOL_BYTES
+
+# Routes that accept print file uploads
+UPLOAD_ROUTES = {"/parse-file", "/parse-files", "/print/from-file"}
+
+def upload_limit(path: str) -> int:
+    return config.MAX_BATCH_BYTES if path == "/parse-files" else config.MAX_UPLOAD_BYTES
+
+class UploadSizeLimit:
+    """
+    Rejects upload bodies over upload_limit with 413 before they are read in full:
+    at once when the declared Content-Length is too large, otherwise (chunked bodies)
+    as soon as the bytes received pass the limit.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in UPLOAD_ROUTES:
+            return await self.app(scope, receive, send)
+        limit = upload_limit(scope["path"])
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(status_code=413, content={"detail": "Upload too large"})
+            return await response(scope, receive, send)
 
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while the form is parsed, and answered by FastAPI as a 413
+                    raise HTTPException(status_code=413, detail="Upload too large")
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+app.add_middleware(UploadSizeLimit)
+
+# Writes go through database.run_write, which serialises them on SQLite
 @app.post("/filament", response_model=schemas.FilamentResponse)
-def create_filament(filament: schemas.FilamentCreate, db: Session = Depends(get_db)):
-    return crud.create_filament(db=db, filament=filament)
+def create_filament(filament: schemas.FilamentCreate):
+    return database.run_write(crud.create_filament, filament=filament)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 @app.get("/filaments", response_model=List[schemas.FilamentResponse])
 def read_filaments(
-    material: Optional[str] = None, 
-    low_stock: bool = False, 
-    db: Session = Depends(get_db)
+    request: Request,
+    material: Optional[List[str]] = Query(None),
+    low_stock: bool = False,
+    min_weight: Optional[float] = None,
+    max_weight: Optional[float] = None,
+    brand: Optional[str] = None,
+    color: Optional[str] = None,
+    search: Optional[str] = None,
+    exclude_empty: bool = False,
+    multicolor: Optional[bool] = None,
+    sort: str = "id",
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    fields: Optional[str] = None,
+    db: Session = Depends(database.get_db)
 ):
-    return crud.get_filaments(db, material=material, low_stock=low_stock)
+    """
+    List spools. Filters: `material` (repeatable), `low_stock` (< 100 g), `min_weight`/
+    `max_weight` (remaining grams), `brand`/`color` (substring), `search` (brand, color or
+    material), `exclude_empty`, `multicolor`. `sort` is a column name, "-" prefixed for
+    descending. `fields=id,brand,...` returns only those fields (id is always included).
+    With `limit`, the response is one page; X-Next-Cursor holds the `cursor` for the next
+    one and is absent on the last page. X-Total-Count is the number of matching spools.
+    X-Inventory-Version is the current inventory version (see /changes); the ETag is
+    derived from it, so If-None-Match returns 304 until a spool changes.
+    """
+    version = crud.get_inventory_version(db)
+    etag = '"' + hashlib.sha256(f"{version}?{request.url.query}".encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Inventory-Version": str(version)}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        rows, next_cursor, total = crud.list_filaments(
+            db, materials=material, low_stock=low_stock, min_weight=min_weight, max_weight=max_weight,
+            brand=brand, color=color, search=search, exclude_empty=exclude_empty, multicolor=multicolor,
+            sort=sort, cursor=cursor, limit=limit,
+            fields=[name.strip() for name in fields.split(",") if name.strip()] if fields else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Rows are plain dicts from the query, serialised directly rather than through
+    # one response model instance per spool
+    headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=json.dumps(rows, default=json_default), media_type="application/json", headers=headers)
+
+@app.get("/changes", response_model=schemas.InventoryChanges)
+def get_changes(since: int = Query(0, ge=0), db: Session = Depends(database.get_db)):
+    """
+    Spools created or changed after inventory version `since` (0 for all of them), and
+    the current version to pass as `since` next time. Cheap to poll when nothing moved.
+    """
+    return Response(
+        content=json.dumps(crud.get_changes(db, since), default=json_default),
+        media_type="application/json"
+    )
+
+@app.get("/filaments/search", response_model=List[schemas.FilamentResponse])
+def search_filaments(
+    q: str,
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Search spools by brand, color and material, best matches first. Partial words and
+    abbreviations work: "blk", "matte wht", "petg gr".
+    """
+    return crud.search_filaments(db, q, limit=limit)
 
 @app.put("/filament/{filament_id}", response_model=schemas.FilamentResponse)
-def update_filament(filament_id: int, filament: schemas.FilamentUpdate, db: Session = Depends(get_db)):
-    db_filament = crud.update_filament(db, filament_id, filament)
+def update_filament(filament_id: int, filament: schemas.FilamentUpdate):
+    db_filament = database.run_write(crud.update_filament, filament_id, filament)
     if db_filament is None:
         raise HTTPException(status_code=404, detail="Filament not found")
     return db_filament
 
 @app.post("/print", response_model=schemas.PrintJobResponse)
-def log_print_job(print_job: schemas.PrintJobCreate, db: Session = Depends(get_db)):
-    return crud.create_print_job(db=db, print_job=print_job)
+def log_print_job(print_job: schemas.PrintJobCreate):
+    return database.run_write(crud.create_print_job, print_job=print_job)
+
+@app.post("/filaments/bulk", response_model=schemas.BulkImportResponse)
+async def bulk_import_filaments(request: Request):
+    """
+    Import many spools at once. The body is NDJSON (one FilamentCreate object per line)
+    or CSV with a header row of FilamentCreate field names (Content-Type: text/csv).
+    Invalid rows are skipped and listed in `errors`.
+    """
+    return await bulk.import_filaments(request)
+
+@app.post("/prints/bulk", response_model=schemas.BulkImportResponse)
+async def bulk_import_print_jobs(request: Request, deduct: bool = True):
+    """
+    Import print history. The body is NDJSON (one PrintJobCreate object per line, with an
+    optional `date`) or CSV with columns name, success, date and filaments_used, where
+    filaments_used is "filament_id:grams" pairs separated by ";".
+    With `deduct=false` the spools' remaining weights are left untouched.
+    Invalid rows are skipped and listed in `errors`.
+    """
+    return await bulk.import_print_jobs(request, deduct=deduct)
 
 @app.get("/stats", response_model=schemas.StatsResponse)
-def get_stats(db: Session = Depends(get_db)):
+def get_stats(db: Session = Depends(database.get_db)):
     return crud.get_stats(db)
 
+@app.get("/stats/timeseries", response_model=schemas.TimeseriesResponse)
+def get_stats_timeseries(
+    request: Request,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    bucket: schemas.TimeseriesBucket = "day",
+    group_by: Optional[schemas.TimeseriesGroup] = None,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Filament usage between `from` and `to` (inclusive, default the last 30 days) in
+    day, week or month buckets, optionally split by material, color, brand or filament.
+    Responses carry an ETag; send it back in If-None-Match to get 304 when unchanged.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' is after 'to'")
+
+    points = crud.get_usage_timeseries(db, start, end, bucket=bucket, group_by=group_by)
+    body = jsonable_encoder(schemas.TimeseriesResponse(
+        start=start, end=end, bucket=bucket, group_by=group_by, points=points
+    ))
+    content = json.dumps(body, separators=(",", ":"))
+    etag = '"' + hashlib.sha256(content.encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# Async variants of the inventory routes. They run on the event loop with an
+# AsyncSession instead of taking a thread from the pool for every request.
+async_router = APIRouter(prefix="/async", tags=["async"])
+
+@app.exception_handler(async_database.AsyncDatabaseUnavailable)
+async def async_database_unavailable(request: Request, e: async_database.AsyncDatabaseUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(e)})
+
+@async_router.post("/filament", response_model=schemas.FilamentResponse)
+async def async_create_filament(filament: schemas.FilamentCreate):
+    return await async_crud.run_write(crud.create_filament, filament=filament)
+
+@async_router.get("/filaments", response_model=List[schemas.FilamentResponse])
+async def async_read_filaments(
+    material: Optional[str] = None,
+    low_stock: bool = False,
+    db: AsyncSession = Depends(async_database.get_async_db)
+):
+    return await async_crud.get_filaments(db, material=material, low_stock=low_stock)
+
+@async_router.put("/filament/{filament_id}", response_model=schemas.FilamentResponse)
+async def async_update_filament(filament_id: int, filament: schemas.FilamentUpdate):
+    db_filament = await async_crud.run_write(crud.update_filament, filament_id, filament)
+    if db_filament is None:
+        raise HTTPException(status_code=404, detail="Filament not found")
+    return db_filament
+
+@async_router.post("/print", response_model=schemas.PrintJobResponse)
+async def async_log_print_job(print_job: schemas.PrintJobCreate):
+    return await async_crud.run_write(crud.create_print_job, print_job=print_job)
+
+@async_router.get("/stats", response_model=schemas.StatsResponse)
+async def async_get_stats(db: AsyncSession = Depends(async_database.get_async_db)):
+    return await async_crud.get_stats(db)
+
+app.include_router(async_router)
+
+async def copy_upload(file: UploadFile, target):
+    """
+    Copies an upload chunk by chunk into `target`.
+    Raises 413 as soon as the upload grows past MAX_UPLOAD_BYTES.
+    Returns the sha256 hex digest of the content.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await file.read(config.UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > config.MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload too large: {file.filename}")
+        digest.update(chunk)
+        target.write(chunk)
+    return digest.hexdigest()
+
+def hash_upload(stream) -> str:
+    """Returns the sha256 hex digest of a seekable stream, rewound afterwards."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    while True:
+        chunk = stream.read(config.UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
 @app.post("/parse-file")
 async def parse_file(file: UploadFile = File(...)):
     """
-    Upload a .gcode or .3mf file to extract estimated filament usage.
-    Returns a list of weights (in grams) found in the file metadata.
+    Upload a G-code (PrusaSlicer, SuperSlicer, Bambu Studio, OrcaSlicer, Cura) or .3mf
+    file to extract estimated filament usage. The format is detected from the content.
+    Returns a list of weights (in grams) found in the file metadata, the
+    per-plate weights for .3mf projects and the slicer's length, volume, cost
+    and print time estimate for .gcode files.
+    Results are cached by content hash; `cache_hit` tells whether the file was parsed.
+    """
+    result, cache_hit = await parse_upload(file)
+    return {"filename": file.filename, **result, "cache_hit": cache_hit}
+
+def flush_parse_hits():
+    # Cache hits are recorded in memory and written now and then, not on every hit
+    if crud.parse_hits_due():
+        database.run_write(crud.flush_parse_hits)
+
+async def cached_parse(cache_key: str):
+    result = await run_in_threadpool(database.run_read, crud.get_cached_parse, cache_key)
+    await run_in_threadpool(flush_parse_hits)
+    return result
+
+async def parse_upload(file: UploadFile):
+    """Parses an uploaded print file through the parse cache. Returns (result, cache hit)."""
+    if file.size is not None and file.size > config.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload too large: {file.filename}")
+    # Starlette has already spooled the upload, so it is hashed and parsed where it is
+    content_hash = await run_in_threadpool(hash_upload, file.file)
+    cache_key = utils.parse_cache_key(content_hash)
+    result = await cached_parse(cache_key)
+    if result is not None:
+        return result, True
+
+    # Parsing is blocking file I/O and regex work, keep it off the event loop
+    result = await run_in_threadpool(utils.parse_print_file, file.file)
+    await run_in_threadpool(database.run_write, crud.store_parse_result, cache_key, result, config.PARSE_CACHE_MAX_ENTRIES, config.PARSE_CACHE_MAX_BYTES)
+    return result, False
+
+def parse_slot_mapping(slots: Optional[str]) -> dict:
+    if not slots:
+        return {}
+    try:
+        mapping = {int(slot): int(filament_id) for slot, filament_id in json.loads(slots).items()}
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=422, detail='slots: expected a JSON object of slot -> filament id, e.g. {"1": 3}')
+    return mapping
+
+@app.post("/print/from-file", response_model=schemas.FilePrintResponse)
+async def log_print_from_file(
+    file: UploadFile = File(...),
+    name: Optional[str] = Form(None),
+    success: bool = Form(True),
+    slots: Optional[str] = Form(None),
+    dry_run: bool = False
+):
+    """
+    Log a print straight from its G-code or .3mf file. The file is parsed (through the
+    parse cache) and each slot it uses is matched to a spool: from `slots`, a JSON
+    object of 1-based slot -> filament id, or else by the slot's color and material in
+    the file. The job is named after the file unless `name` is given.
+    With `dry_run=true` nothing is logged and the matches are returned to review.
     """
-    contents = await file.read()
-    weights = utils.parse_material_usage(contents, file.filename)
-    return {"filename": file.filename, "estimated_weights_g": weights}
+    mapping = parse_slot_mapping(slots)
+    parsed, _ = await parse_upload(file)
+    try:
+        matched, print_job = await run_in_threadpool(
+            database.run_write, crud.log_file_print, parsed, name or file.filename or "Print",
+            success=success, mapping=mapping, dry_run=dry_run
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return schemas.FilePrintResponse(
+        filename=file.filename, dialect=parsed.get("dialect"), slots=matched,
+        print_job=schemas.PrintJobResponse.model_validate(print_job) if print_job is not None else None
+    )
+
+def is_within(root: str, path: str) -> bool:
+    try:
+        return os.path.commonpath([root, path]) == root
+    except ValueError:
+        # Different drives on Windows
+        return False
+
+@app.post("/parse-path")
+def parse_path(request: schemas.ParsePathRequest, db: Session = Depends(database.get_db)):
+    """
+    Parse a print file that is already on this machine (e.g. a watched slicer output
+    directory). Only files under FILAMENT_PARSE_PATH_ROOTS are allowed.
+    Text G-code is memory-mapped and scanned from the end, so large files cost about
+    the same as small ones. Results are cached by path, size and modification time.
+    """
+    path = os.path.realpath(request.path)
+    if not any(is_within(root, path) for root in config.PARSE_PATH_ROOTS):
+        raise HTTPException(status_code=403, detail="Path is outside the allowed directories")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    stat = os.stat(path)
+    cache_key = utils.parse_cache_key(f"path:{path}:{stat.st_size}:{stat.st_mtime_ns}")
+    result = crud.get_cached_parse(db, cache_key)
+    flush_parse_hits()
+    if result is not None:
+        return {"path": path, **result, "cache_hit": True}
+
+    result = utils.parse_print_file_path(path)
+    database.run_write(crud.store_parse_result, cache_key, result, config.PARSE_CACHE_MAX_ENTRIES, config.PARSE_CACHE_MAX_BYTES)
+    return {"path": path, **result, "cache_hit": False}
+
+@app.post("/parse-files")
+async def parse_files(files: List[UploadFile] = File(...)):
+    """
+    Upload several .gcode/.3mf files at once.
+    Files are parsed in parallel in a process pool and one JSON line per file is
+    streamed back (application/x-ndjson) in the order they finish, each with the
+    file's position in the upload as `index`.
+    """
+    if len(files) > config.MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {config.MAX_BATCH_FILES} files per batch")
+
+    # Worker processes read the uploads from disk
+    uploads = []
+    paths = []
+    try:
+        for index, file in enumerate(files):
+            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as target:
+                paths.append(target.name)
+                content_hash = await copy_upload(file, target)
+            uploads.append((index, file.filename, target.name, content_hash))
+    except BaseException:
+        remove_files(paths)
+        raise
+
+    return StreamingResponse(stream_batch_results(uploads, paths), media_type="application/x-ndjson")
+
+def remove_files(paths: List[str]):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+async def stream_batch_results(uploads, paths: List[str]):
+    loop = asyncio.get_running_loop()
+    try:
+        pending = {}
+        for index, filename, path, content_hash in uploads:
+            cache_key = utils.parse_cache_key(content_hash)
+            result = await cached_parse(cache_key)
+            if result is not None:
+                yield json.dumps({"index": index, "filename": filename, **result, "cache_hit": True}) + "\n"
+                continue
+            future = loop.run_in_executor(get_parse_pool(), utils.parse_print_file_path, path)
+            pending[future] = (index, filename, cache_key)
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                index, filename, cache_key = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield json.dumps({"index": index, "filename": filename, "error": str(e)}) + "\n"
+                    continue
+                await run_in_threadpool(database.run_write, crud.store_parse_result, cache_key, result, config.PARSE_CACHE_MAX_ENTRIES, config.PARSE_CACHE_MAX_BYTES)
+                yield json.dumps({"index": index, "filename": filename, **result, "cache_hit": False}) + "\n"
+    finally:
+        remove_files(paths)
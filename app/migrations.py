@@ -0,0 +1,314 @@
+"""
+Schema migrations, applied in order at startup (see main.lifespan).
+
+Each migration has a version, a name and a function that receives a connection
+inside a transaction. Applied versions are recorded in schema_migrations. Steps use
+checkfirst, so databases created by the old create_all-at-import code are upgraded
+in place. On PostgreSQL every step runs under an advisory lock and is skipped if
+another worker applied it meanwhile, so workers starting together can't apply a
+step twice. SQLite databases are served by a single backend process.
+
+Tables are defined here as each migration created them, not taken from models.py,
+so a released migration never changes when the models do.
+
+    python -m app.migrations                 # apply pending migrations
+    python -m app.migrations --check-plans   # fail if hot queries stop using their indexes
+"""
+import argparse
+import sqlite3
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+from sqlalchemy import (
+    Boolean, Column, Connection, Date, DateTime, Engine, Float, ForeignKey, Index, Integer, MetaData, String,
+    Table, Text, create_engine, event, func, insert, inspect, literal, select, text, update
+)
+from sqlalchemy.orm import Session
+from . import schemas, crud, database, rollups
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+# The tables as the migration that creates them left them. Never edit a released
+# definition; later changes are new migrations.
+metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime),
+)
+
+# 1. baseline, as the create_all-at-import code made them
+filaments = Table(
+    "filaments", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("brand", String, index=True),
+    Column("material", String, index=True),
+    Column("color_name", String),
+    Column("color_hex", String),
+    Column("is_multicolor", Boolean),
+    Column("initial_weight", Float),
+    Column("remaining_weight", Float),
+    Column("purchase_date", DateTime),
+    Column("price", Float),
+)
+print_jobs = Table(
+    "print_jobs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String),
+    Column("date", DateTime),
+    Column("success", Boolean),
+)
+filament_usages = Table(
+    "filament_usages", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("print_job_id", Integer, ForeignKey("print_jobs.id")),
+    Column("filament_id", Integer, ForeignKey("filaments.id")),
+    Column("grams_used", Float),
+)
+parse_cache = Table(
+    "parse_cache", metadata,
+    Column("key", String, primary_key=True),
+    Column("result", Text),
+    Column("size_bytes", Integer),
+    Column("created_at", DateTime),
+    Column("last_used", DateTime, index=True),
+    Column("hits", Integer),
+)
+
+# 3. usage rollups
+usage_rollups = Table(
+    "usage_rollups", metadata,
+    Column("dimension", String, primary_key=True),
+    Column("key", String, primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("grams", Float),
+    Column("cost", Float),
+    Column("job_count", Integer),
+)
+
+# 6. inventory changes (8 adds the version column)
+inventory_changes = Table(
+    "inventory_changes", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("filament_id", Integer, index=True),
+    Column("changed_at", DateTime),
+    sqlite_autoincrement=True,
+)
+
+# 8. commit ordered inventory versions
+inventory_version = Table(
+    "inventory_version", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+
+def create_tables(*tables):
+    def apply(conn: Connection):
+        for table in tables:
+            table.create(conn, checkfirst=True)
+    return apply
+
+def create_index(name: str, table: str, *columns: str):
+    def apply(conn: Connection):
+        # Built on a stub of the table, so the index isn't attached to the definitions above
+        stub = Table(table, MetaData(), *(Column(column) for column in columns))
+        Index(name, *stub.c).create(conn, checkfirst=True)
+    return apply
+
+def steps(*applies):
+    def apply(conn: Connection):
+        for step in applies:
+            step(conn)
+    return apply
+
+def create_rollups(conn: Connection):
+    usage_rollups.create(conn, checkfirst=True)
+    # Backfill from the existing history in the same transaction
+    with Session(bind=conn) as db:
+        rollups.rebuild(db)
+        db.flush()
+
+# External-content FTS5 index over the searchable spool columns; the triggers keep it
+# in step with every insert, update and delete on filaments, bulk imports included
+FILAMENT_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS filaments_fts USING fts5(
+        brand, color_name, material, content='filaments', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS filaments_fts_insert AFTER INSERT ON filaments BEGIN
+        INSERT INTO filaments_fts(rowid, brand, color_name, material)
+        VALUES (new.id, new.brand, new.color_name, new.material);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS filaments_fts_delete AFTER DELETE ON filaments BEGIN
+        INSERT INTO filaments_fts(filaments_fts, rowid, brand, color_name, material)
+        VALUES ('delete', old.id, old.brand, old.color_name, old.material);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS filaments_fts_update AFTER UPDATE OF brand, color_name, material ON filaments BEGIN
+        INSERT INTO filaments_fts(filaments_fts, rowid, brand, color_name, material)
+        VALUES ('delete', old.id, old.brand, old.color_name, old.material);
+        INSERT INTO filaments_fts(rowid, brand, color_name, material)
+        VALUES (new.id, new.brand, new.color_name, new.material);
+    END""",
+    "INSERT INTO filaments_fts(filaments_fts) VALUES ('rebuild')",
+]
+
+def create_filament_search(conn: Connection):
+    # The trigram tokenizer needs SQLite 3.34; elsewhere crud.search_filaments uses LIKE
+    if conn.dialect.name != "sqlite" or sqlite3.sqlite_version_info < (3, 34):
+        return
+    for statement in FILAMENT_SEARCH_DDL:
+        conn.execute(text(statement))
+
+def create_inventory_changes(conn: Connection):
+    inventory_changes.create(conn, checkfirst=True)
+    # Every existing spool starts out changed, so a client syncing from version 0 gets them all
+    conn.execute(
+        insert(inventory_changes).from_select(
+            ["filament_id", "changed_at"],
+            select(filaments.c.id, literal(datetime.now())).order_by(filaments.c.id)
+        )
+    )
+
+def version_inventory_changes(conn: Connection):
+    # Versions move from the inventory_changes ids to a counter bumped in each write's
+    # transaction; existing changes keep their id as their version
+    if "version" not in {column["name"] for column in inspect(conn).get_columns("inventory_changes")}:
+        conn.execute(text("ALTER TABLE inventory_changes ADD COLUMN version INTEGER"))
+    create_index("ix_inventory_changes_version", "inventory_changes", "version")(conn)
+    conn.execute(text("UPDATE inventory_changes SET version = id WHERE version IS NULL"))
+    inventory_version.create(conn, checkfirst=True)
+    if conn.scalar(select(inventory_version.c.id)) is None:
+        conn.execute(insert(inventory_version).values(
+            id=1, version=conn.scalar(text("SELECT MAX(version) FROM inventory_changes")) or 0
+        ))
+
+def size_parse_cache_results(conn: Connection):
+    # size_bytes held the size of the parsed file; the cache's byte limit counts results
+    conn.execute(update(parse_cache).values(size_bytes=func.length(parse_cache.c.result)))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", create_tables(filaments, print_jobs, filament_usages, parse_cache)),
+    Migration(2, "hot path indexes", steps(
+        create_index("ix_print_jobs_date", "print_jobs", "date"),
+        create_index("ix_filament_usages_filament_job", "filament_usages", "filament_id", "print_job_id"),
+        create_index("ix_filament_usages_print_job", "filament_usages", "print_job_id"),
+        create_index("ix_filaments_material_remaining", "filaments", "material", "remaining_weight"),
+    )),
+    Migration(3, "usage rollups", create_rollups),
+    Migration(4, "filament weight index", create_index("ix_filaments_remaining_weight", "filaments", "remaining_weight")),
+    Migration(5, "filament search index", create_filament_search),
+    Migration(6, "inventory changes", create_inventory_changes),
+    Migration(7, "filament color index", create_index("ix_filaments_color_hex", "filaments", "color_hex")),
+    Migration(8, "commit ordered inventory versions", version_inventory_changes),
+    Migration(9, "parse cache result sizes", size_parse_cache_results),
+]
+
+# Arbitrary key of the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_KEY = 7_302_815_114
+
+
+def lock_migrations(conn: Connection):
+    """Blocks other workers' migrations until this transaction ends (PostgreSQL only)."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+def applied_versions(conn: Connection) -> set:
+    return set(conn.scalars(select(schema_migrations.c.version)))
+
+def run_migrations(engine: Engine = None) -> List[str]:
+    """Applies pending migrations, each in its own transaction. Returns the names applied."""
+    engine = engine or database.engine
+    with engine.begin() as conn:
+        lock_migrations(conn)
+        schema_migrations.create(conn, checkfirst=True)
+        done = applied_versions(conn)
+
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version in done:
+            continue
+        with engine.begin() as conn:
+            lock_migrations(conn)
+            # Checked again under the lock: another worker may have applied it since
+            if migration.version in applied_versions(conn):
+                continue
+            migration.apply(conn)
+            conn.execute(insert(schema_migrations).values(
+                version=migration.version, name=migration.name, applied_at=datetime.now()
+            ))
+        applied.append(migration.name)
+    return applied
+
+
+# Query plan checks: each runs a crud function against an empty SQLite database and
+# fails if the plans of the queries it executed stop using the listed indexes.
+PLAN_CHECKS = [
+    ("stats: from rollups", crud.get_stats,
+     ["sqlite_autoindex_usage_rollups_1"]),
+    ("filaments: low stock by material", lambda db: crud.get_filaments(db, material="PLA", low_stock=True),
+     ["ix_filaments_material_remaining"]),
+    ("filaments: page by weight", lambda db: crud.list_filaments(db, min_weight=100, sort="remaining_weight", limit=50),
+     ["ix_filaments_remaining_weight"]),
+    ("filaments: suggest spools for a print file",
+     lambda db: crud.suggest_spools(db, [schemas.FileSlot(slot=1, grams=10, color="#FFFFFF", material="PLA")]),
+     ["ix_filaments_color_hex", "ix_filaments_material_remaining"]),
+    ("changes: spools changed since a version", lambda db: crud.get_changes(db, 100),
+     ["ix_inventory_changes_version"]),
+]
+
+def query_plans(engine: Engine, fn) -> List[str]:
+    """Runs fn(db) and returns the EXPLAIN QUERY PLAN lines of every SELECT it executed."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with Session(engine) as db:
+            fn(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    plan = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            plan.extend(row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+    return plan
+
+def check_plans() -> bool:
+    engine = create_engine("sqlite://")
+    run_migrations(engine)
+    ok = True
+    for name, fn, indexes in PLAN_CHECKS:
+        plan = query_plans(engine, fn)
+        missing = [i for i in indexes if not any(f"INDEX {i} " in line for line in plan)]
+        ok = ok and not missing
+        print(f"{'ok' if not missing else 'FAIL':<5} {name}" + (f" (not using {', '.join(missing)})" if missing else ""))
+        for line in plan:
+            print(f"      {line}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check-plans", action="store_true", help="Check that hot queries use indexes (exit 1 if not)")
+    args = parser.parse_args(argv)
+
+    if args.check_plans:
+        sys.exit(0 if check_plans() else 1)
+    applied = run_migrations()
+    print("Applied: " + ", ".join(applied) if applied else "Up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Date, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
 
 class Filament(Base):
     __tablename__ = "filaments"
+    __table_args__ = (
+        Index("ix_filaments_material_remaining", "material", "remaining_weight"),  # low stock by material
+        Index("ix_filaments_remaining_weight", "remaining_weight"),
+        Index("ix_filaments_color_hex", "color_hex"),  # spool suggestions for print files
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     brand = Column(String, index=True)
@@ -22,6 +27,9 @@ class Filament(Base):
 
 class PrintJob(Base):
     __tablename__ = "print_jobs"
+    __table_args__ = (
+        Index("ix_print_jobs_date", "date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
@@ -33,6 +41,10 @@ class PrintJob(Base):
 
 class FilamentUsage(Base):
     __tablename__ = "filament_usages"
+    __table_args__ = (
+        Index("ix_filament_usages_filament_job", "filament_id", "print_job_id"),
+        Index("ix_filament_usages_print_job", "print_job_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     print_job_id = Column(Integer, ForeignKey("print_jobs.id"))
@@ -43,3 +55,50 @@ class FilamentUsage(Base):
     filament = relationship("Filament", back_populates="usages")
 
 
+class ParseCacheEntry(Base):
+    __tablename__ = "parse_cache"
+
+    key = Column(String, primary_key=True)  # parser version + sha256 of the content (see utils.parse_cache_key)
+    result = Column(Text)  # JSON encoded parse result
+    size_bytes = Column(Integer)  # size of the stored result, for the cache's byte limit
+    created_at = Column(DateTime, default=datetime.now)
+    last_used = Column(DateTime, default=datetime.now, index=True)
+    hits = Column(Integer, default=0)
+
+
+class UsageRollup(Base):
+    __tablename__ = "usage_rollups"  # daily usage totals, maintained by rollups.py
+
+    dimension = Column(String, primary_key=True)  # total, filament, color, material, brand
+    key = Column(String, primary_key=True)  # filament id, color name, material or brand; "" for total
+    day = Column(Date, primary_key=True)
+    grams = Column(Float, default=0.0)
+    cost = Column(Float, default=0.0)  # grams priced at the spool's price per gram
+    job_count = Column(Integer, default=0)
+
+
+class InventoryChange(Base):
+    __tablename__ = "inventory_changes"  # latest change per spool, see crud.record_changes
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    filament_id = Column(Integer, index=True)
+    version = Column(Integer, index=True)  # inventory version the change was made in
+    changed_at = Column(DateTime, default=datetime.now)
+
+
+class InventoryVersion(Base):
+    # A single row (id 1) holding the current inventory version, bumped by every write so
+    # versions follow commit order on any backend (see crud.record_changes)
+    __tablename__ = "inventory_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_at = Column(DateTime, default=datetime.now)
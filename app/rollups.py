@@ -0,0 +1,145 @@
+"""
+Daily usage rollups behind /stats and /stats/timeseries.
+
+Every logged print job adds its grams, cost and a job count to one usage_rollups row
+per (dimension, key, day): the day total, and the day's row for each spool, color,
+material and brand it used. Rows are upserted in the job's own transaction, so the
+rollups always match the usage table. Spool attributes are taken as they are when the
+job is logged; a rebuild re-keys history with the current ones.
+
+    python -m app.rollups    # rebuild all rollups from print_jobs/filament_usages
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import delete, select, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import models, database
+
+DIMENSIONS = ("total", "filament", "color", "material", "brand")
+
+# (day, dimension, key) -> [grams, cost, job_count]
+Totals = Dict[Tuple[date, str, str], list]
+
+UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def usage_cost(filament, grams: float) -> float:
+    if filament is None or not filament.initial_weight or filament.price is None:
+        return 0.0
+    return grams * filament.price / filament.initial_weight
+
+def usage_keys(filament_id: int, filament) -> List[Tuple[str, str]]:
+    keys = [("total", ""), ("filament", str(filament_id))]
+    if filament is not None:
+        keys += [
+            ("color", filament.color_name or ""),
+            ("material", filament.material or ""),
+            ("brand", filament.brand or ""),
+        ]
+    return keys
+
+def add_job(totals: Totals, day: date, usages: Iterable[Tuple[int, float]], filaments: dict):
+    """Adds one job's (filament_id, grams) usages to totals; each key the job touches counts it once."""
+    touched = {("total", "")}
+    for filament_id, grams in usages:
+        filament = filaments.get(filament_id)
+        cost = usage_cost(filament, grams)
+        keys = usage_keys(filament_id, filament)
+        for dimension, key in keys:
+            entry = totals.setdefault((day, dimension, key), [0.0, 0.0, 0])
+            entry[0] += grams
+            entry[1] += cost
+        touched.update(keys)
+    for dimension, key in touched:
+        totals.setdefault((day, dimension, key), [0.0, 0.0, 0])[2] += 1
+
+def upsert(db: Session, totals: Totals):
+    """Adds totals onto the stored rollups without committing."""
+    if not totals:
+        return
+    table = models.UsageRollup.__table__
+    rows = [
+        {"day": day, "dimension": dimension, "key": key, "grams": grams, "cost": cost, "job_count": jobs}
+        for (day, dimension, key), (grams, cost, jobs) in totals.items()
+    ]
+    dialect_insert = UPSERT_DIALECTS.get(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(table)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.dimension, table.c.key, table.c.day],
+            set_={
+                "grams": table.c.grams + statement.excluded.grams,
+                "cost": table.c.cost + statement.excluded.cost,
+                "job_count": table.c.job_count + statement.excluded.job_count,
+            }
+        ), rows)
+        return
+    for row in rows:
+        updated = db.execute(
+            update(table)
+            .where(table.c.dimension == row["dimension"], table.c.key == row["key"], table.c.day == row["day"])
+            .values(
+                grams=table.c.grams + row["grams"],
+                cost=table.c.cost + row["cost"],
+                job_count=table.c.job_count + row["job_count"]
+            )
+        )
+        if updated.rowcount == 0:
+            db.execute(insert(table), row)
+
+def record_jobs(db: Session, jobs: List[Tuple[datetime, list]], filaments: dict):
+    """
+    Adds new print jobs, given as (date, usages) pairs with FilamentUsageBase usages,
+    to the rollups. `filaments` holds the used spools by id (see crud.load_spools).
+    Called by crud inside the transaction that inserts the jobs.
+    """
+    totals: Totals = {}
+    for job_date, usages in jobs:
+        add_job(totals, job_date.date(), [(usage.filament_id, usage.grams_used) for usage in usages], filaments)
+    upsert(db, totals)
+
+def rebuild(db: Session) -> int:
+    """Recomputes every rollup from the print history without committing. Returns the row count."""
+    db.execute(delete(models.UsageRollup))
+    filaments = {filament.id: filament for filament in db.scalars(select(models.Filament))}
+    rows = db.execute(
+        select(models.PrintJob.id, models.PrintJob.date, models.FilamentUsage.filament_id, models.FilamentUsage.grams_used)
+        .outerjoin(models.FilamentUsage, models.FilamentUsage.print_job_id == models.PrintJob.id)
+        .order_by(models.PrintJob.id)
+        .execution_options(yield_per=5000)
+    )
+    totals: Totals = {}
+    job_id, job_date, usages = None, None, []
+    for row_job_id, row_date, filament_id, grams in rows:
+        if row_job_id != job_id:
+            if job_id is not None:
+                add_job(totals, job_date.date(), usages, filaments)
+            job_id, job_date, usages = row_job_id, row_date, []
+        if filament_id is not None:
+            usages.append((filament_id, grams or 0.0))
+    if job_id is not None:
+        add_job(totals, job_date.date(), usages, filaments)
+    upsert(db, totals)
+    return len(totals)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args(argv)
+    with database.SessionLocal() as db:
+        count = rebuild(db)
+        db.commit()
+    print(f"Rebuilt {count} rollup rows")
+
+
+if __name__ == "__main__":
+    main()
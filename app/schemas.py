@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+from typing import List, Literal, Optional
+from datetime import date, datetime
 
 # Filament Schemas
 class FilamentBase(BaseModel):
@@ -41,6 +41,7 @@ class FilamentUsageBase(BaseModel):
 class PrintJobCreate(BaseModel):
     name: str
     success: bool = True
+    date: Optional[datetime] = None  # defaults to now; set when importing history
     filaments_used: List[FilamentUsageBase]
 
 class FilamentUsageResponse(FilamentUsageBase):
@@ -60,7 +61,57 @@ class PrintJobResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class InventoryChanges(BaseModel):
+    version: int
+    changed: List[FilamentResponse]
+    deleted: List[int] = []
+
 # Stats Schema
 class StatsResponse(BaseModel):
     total_plastic_used_this_month: float
     most_used_color: str
+
+TimeseriesBucket = Literal["day", "week", "month"]
+TimeseriesGroup = Literal["material", "color", "brand", "filament"]
+
+class TimeseriesPoint(BaseModel):
+    bucket: date  # first day of the day/week (Monday)/month
+    key: str  # material, color, brand or filament id; "" when not grouped
+    grams: float
+    cost: float
+    prints: int
+
+class TimeseriesResponse(BaseModel):
+    start: date
+    end: date
+    bucket: TimeseriesBucket
+    group_by: Optional[TimeseriesGroup] = None
+    points: List[TimeseriesPoint]
+
+# Bulk Import Schemas
+class BulkRowError(BaseModel):
+    row: int  # 1-based, not counting a CSV header
+    error: str
+
+class BulkImportResponse(BaseModel):
+    received: int
+    created: int
+    errors: List[BulkRowError] = []
+
+# Parse Schemas
+class ParsePathRequest(BaseModel):
+    path: str
+
+class FileSlot(BaseModel):
+    slot: int  # 1-based AMS/extruder slot
+    grams: float
+    color: str = ""  # "#RRGGBB" from the file, "" when unknown
+    material: str = ""
+    filament_id: Optional[int] = None
+    suggested: bool = False  # filament_id was matched by color/material, not given
+
+class FilePrintResponse(BaseModel):
+    filename: Optional[str] = None
+    dialect: Optional[str] = None
+    slots: List[FileSlot]
+    print_job: Optional[PrintJobResponse] = None  # None for a dry run
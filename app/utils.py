@@ -1,93 +1,627 @@
 import zipfile
 import re
 import io
-from typing import List
+import math
+import mmap
+import os
+import struct
+import zlib
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass, field
+from typing import BinaryIO, Callable, Dict, List, Optional, Union
 
-def parse_material_usage(file_content: bytes, filename: str) -> List[float]:
+# Slicers write their metadata in a header block at the top of the file and a
+# config/summary block at the very end; everything in between is toolpath.
+HEAD_SCAN_BYTES = 256 * 1024
+TAIL_SCAN_BYTES = 512 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+# Tail windows tried in turn by scan_gcode_path before widening further
+TAIL_WINDOWS = (256 * 1024, 1024 * 1024, 16 * 1024 * 1024)
+
+# Text G-code dialects, scanned tail first by scan_gcode_regions (memory-mapped for files on disk)
+MMAP_DIALECTS = {"bambu", "orca", "prusaslicer", "superslicer", "gcode"}
+
+# Enough of the file to recognise the slicer from its first lines
+SNIFF_BYTES = 16 * 1024
+CURA_HEADER_BYTES = 4 * 1024
+
+# Binary G-code (.bgcode) block types and compression methods
+BGCODE_MAGIC = b"GCDE"
+BGCODE_BLOCK_GCODE = 1
+BGCODE_BLOCK_THUMBNAIL = 5
+# file metadata, printer metadata, print metadata (the slicer config block is skipped)
+BGCODE_METADATA_BLOCKS = (0, 3, 4)
+BGCODE_COMPRESSION_NONE = 0
+BGCODE_COMPRESSION_DEFLATE = 1
+
+# Cura only reports length; grams assume 1.75 mm filament at PLA density (g/cm3)
+CURA_FILAMENT_DIAMETER_MM = 1.75
+DEFAULT_FILAMENT_DENSITY = 1.24
+
+# Bump whenever the parse output changes so cached results are not reused
+PARSER_VERSION = 8
+
+SLICE_INFO_MEMBER = "Metadata/slice_info.config"
+
+
+@dataclass
+class PlateUsage:
+    index: int  # 1-based plate number as shown in the slicer
+    weights_g: List[float]  # grams per filament slot, slot 1 first
+    colors: List[str] = field(default_factory=list)  # "#RRGGBB" per slot, "" when unknown
+    types: List[str] = field(default_factory=list)  # material per slot, "" when unknown
+
+
+@dataclass
+class GcodeMetadata:
+    """Slicer estimates found in a G-code file; lists hold one value per filament slot."""
+    weights_g: List[float] = field(default_factory=list)
+    lengths_mm: List[float] = field(default_factory=list)
+    volumes_cm3: List[float] = field(default_factory=list)
+    costs: List[float] = field(default_factory=list)
+    total_cost: Optional[float] = None
+    print_time_s: Optional[int] = None
+    colors: List[str] = field(default_factory=list)  # "#RRGGBB"
+    types: List[str] = field(default_factory=list)  # PLA, PETG, ...
+
+# One alternative per known metadata key; each is a named group so a match tells which key it was.
+# Weight keys, in the precedence order used to pick the weights:
+#   ; filament used [g] = 23.4, 10.1, 0         (PrusaSlicer/Bambu footer)
+#   ; total filament used [g] = 23.4
+#   ; total filament weight [g] : 2.58,0.97     (Bambu Studio header block)
+#   ; filament_used_g = 12.4                    (config style key)
+# Slot colors and materials come from the config block, one value per slot separated by ";":
+#   ; filament_colour = #FFFFFF;#161616
+#   ; filament_type = PLA;PETG
+METADATA_KEYS = {
+    "filament_used_g": rb"filament used[ \t]*\[g\]",
+    "total_filament_used_g": rb"total filament used[ \t]*\[g\]",
+    "total_filament_weight_g": rb"total filament weight[ \t]*\[g\]",
+    "config_filament_used_g": rb"filament_used_g",
+    "filament_used_mm": rb"(?:filament used|total filament length)[ \t]*\[mm\]",
+    "filament_used_cm3": rb"(?:filament used[ \t]*\[cm3\]|total filament volume[ \t]*\[cm\^3\])",
+    "filament_cost": rb"filament cost",
+    "total_filament_cost": rb"total filament cost",
+    "print_time": rb"(?:estimated printing time \(normal mode\)|total estimated time)",
+    "filament_colour": rb"filament_colour",
+    "filament_type": rb"filament_type",
+}
+WEIGHT_KEYS = ("filament_used_g", "total_filament_used_g", "total_filament_weight_g", "config_filament_used_g")
+
+# Per-slot keys; their values are ";" separated lists, other values end at the next ";"
+SLOT_KEYS = ("filament_colour", "filament_type")
+
+METADATA_RE = re.compile(
+    rb";[ \t]*(?:[^;\r\n]*;[ \t]*)?(?:"
+    + b"|".join(b"(?P<%s>%s)" % (key.encode(), pattern) for key, pattern in METADATA_KEYS.items())
+    + rb")[ \t]*[:=][ \t]*(?P<value>"
+    # (?(key)...|...) conditionals: the rest of the line for a slot key, else up to ";"
+    + b"".join(rb"(?(%s)[^\r\n]*|" % key.encode() for key in SLOT_KEYS)
+    + rb"[^;\r\n]*" + b")" * len(SLOT_KEYS) + rb")"
+)
+
+def parse_material_usage(source: Union[bytes, BinaryIO], filename: Optional[str] = None) -> List[float]:
     """
-    Parses .gcode or .3mf files to extract filament usage.
+    Parses print files (G-code from any registered slicer, or 3MF) to extract filament usage.
+    `source` can be the raw bytes or a seekable binary file object (e.g. an upload).
+    The format is sniffed from the content; `filename` is accepted for compatibility only.
     Returns a list of weights (in grams) for each filament slot/index.
     """
-    filename = filename.lower()
-    if filename.endswith(".gcode"):
-        return parse_gcode(file_content)
-    elif filename.endswith(".3mf"):
-        return parse_3mf(file_content)
-    return []
+    return parse_print_file(source)["estimated_weights_g"]
 
-def parse_gcode(content: bytes) -> List[float]:
-    text = content.decode("utf-8", errors="ignore")
-    
-    # Pattern 1: Standard Bambu/Prusa comment
-    # ; filament used [g] = 23.4, 10.1, 0
-    match = re.search(r";\s*filament used\s*\[g\]\s*=\s*(.*)", text)
+def parse_print_file(source: Union[bytes, BinaryIO]) -> dict:
+    """
+    Builds the /parse-file payload: the detected dialect, the total weights per slot,
+    plus the per-plate breakdown for 3MF projects and the full slicer estimate for G-code.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    head = source.read(SNIFF_BYTES)
+    source.seek(0)
+    dialect = sniff_dialect(head)
+    if dialect is None:
+        return {"dialect": None, "estimated_weights_g": []}
+    return {"dialect": dialect.name, **dialect.parse(source)}
+
+def parse_print_file_path(path: str) -> dict:
+    """
+    parse_print_file for a file on disk; module level so process pools can pickle it.
+    Text G-code is memory-mapped and scanned tail first (see scan_gcode_path).
+    """
+    with open(path, "rb") as f:
+        dialect = sniff_dialect(f.read(SNIFF_BYTES))
+        f.seek(0)
+        if dialect is None:
+            return {"dialect": None, "estimated_weights_g": []}
+        if dialect.name in MMAP_DIALECTS:
+            return {"dialect": dialect.name, **_gcode_payload(scan_gcode_path(path))}
+        return {"dialect": dialect.name, **dialect.parse(f)}
+
+def parse_gcode_path(path: str) -> List[float]:
+    return scan_gcode_path(path).weights_g
+
+def scan_gcode_path(path: str) -> GcodeMetadata:
+    """Extracts the slicer estimates from a G-code file on disk without copying it (see scan_gcode_regions)."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return GcodeMetadata()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return scan_gcode_regions(MmapRegions(mm))
+
+def scan_gcode_regions(regions) -> GcodeMetadata:
+    """
+    Extracts the slicer estimates from text G-code. The last TAIL_WINDOWS[0] bytes are
+    searched first, where slicers write their summary and config block; then the header
+    block, and only then the tail window is widened step by step up to the whole file.
+    Uploads and files on disk both go through here, so the same bytes always parse the
+    same way whichever endpoint reads them (their results share the parse cache).
+    """
+    found: Dict[str, bytes] = {}
+    size = regions.size
+    if size == 0:
+        return GcodeMetadata()
+    end = size
+    window_start = regions.line_start(size - TAIL_WINDOWS[0])
+    regions.scan(found, window_start, end)
+    if any(key in found for key in WEIGHT_KEYS):
+        return metadata_from_matches(found)
+
+    header_end = regions.find(b"HEADER_BLOCK_END", min(size, HEAD_SCAN_BYTES))
+    header_end = regions.line_start(header_end if header_end >= 0 else HEAD_SCAN_BYTES)
+    regions.scan(found, 0, min(header_end, window_start))
+
+    windows = list(TAIL_WINDOWS[1:])
+    window = TAIL_WINDOWS[0]
+    while not any(key in found for key in WEIGHT_KEYS) and window_start > header_end:
+        window = windows.pop(0) if windows else window * 4
+        end = window_start
+        window_start = max(header_end, regions.line_start(size - window))
+        regions.scan(found, window_start, end)
+    return metadata_from_matches(found)
+
+class MmapRegions:
+    """Regions of a memory-mapped file for scan_gcode_regions, searched in place."""
+    def __init__(self, mm: mmap.mmap):
+        self.mm = mm
+        self.size = len(mm)
+
+    def line_start(self, offset: int) -> int:
+        return _line_start(self.mm, offset)
+
+    def find(self, needle: bytes, end: int) -> int:
+        return self.mm.find(needle, 0, end)
+
+    def scan(self, found: Dict[str, bytes], start: int, end: int):
+        scan_metadata(self.mm, found, start, end)
+
+class StreamRegions:
+    """Regions of a seekable stream for scan_gcode_regions, read in line aligned chunks."""
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.size = stream.seek(0, io.SEEK_END)
+
+    def line_start(self, offset: int) -> int:
+        if offset <= 0:
+            return 0
+        self.stream.seek(offset - 1)
+        self.stream.readline()
+        return self.stream.tell()
+
+    def find(self, needle: bytes, end: int) -> int:
+        self.stream.seek(0)
+        return self.stream.read(end).find(needle)
+
+    def scan(self, found: Dict[str, bytes], start: int, end: int):
+        scan_chunks(self.stream, start, found, end)
+
+def _line_start(mm: mmap.mmap, offset: int) -> int:
+    """The start of the first line at or after `offset`."""
+    if offset <= 0:
+        return 0
+    newline = mm.find(b"\n", offset - 1)
+    return len(mm) if newline < 0 else newline + 1
+
+def parse_cache_key(content_id: str) -> str:
+    """
+    Cache key for a parse result. `content_id` identifies the file content: its sha256,
+    or path, size and mtime for local files. The parser is chosen from the content.
+    """
+    return f"v{PARSER_VERSION}:{content_id}"
+
+
+# --- Slicer dialects ---
+# Each dialect has a sniff(head) check over the first SNIFF_BYTES of the file and a
+# parse(stream) that returns the payload fields. Dialects are tried in registration
+# order, so specific ones must be registered before the generic text fallback.
+
+@dataclass
+class SlicerDialect:
+    name: str
+    sniff: Callable[[bytes], bool]
+    parse: Callable[[BinaryIO], dict]
+
+DIALECTS: List[SlicerDialect] = []
+
+def register_dialect(name: str, sniff: Callable[[bytes], bool]):
+    def decorator(parse: Callable[[BinaryIO], dict]):
+        DIALECTS.append(SlicerDialect(name=name, sniff=sniff, parse=parse))
+        return parse
+    return decorator
+
+def sniff_dialect(head: bytes) -> Optional[SlicerDialect]:
+    for dialect in DIALECTS:
+        if dialect.sniff(head):
+            return dialect
+    return None
+
+def _gcode_payload(metadata: GcodeMetadata) -> dict:
+    return {
+        "estimated_weights_g": metadata.weights_g,
+        "filament_colors": metadata.colors,
+        "filament_types": metadata.types,
+        "estimate": asdict(metadata)
+    }
+
+@register_dialect("3mf", lambda head: head.startswith(b"PK\x03\x04"))
+def _parse_3mf_dialect(stream: BinaryIO) -> dict:
+    plates = parse_3mf_plates(stream)
+    return {
+        "estimated_weights_g": sum_plate_weights(plates),
+        "filament_colors": merge_plate_slots(plates, "colors"),
+        "filament_types": merge_plate_slots(plates, "types"),
+        "plates": [asdict(plate) for plate in plates]
+    }
+
+def _parse_text_gcode(stream: BinaryIO) -> dict:
+    if not stream.seekable():
+        return _gcode_payload(scan_gcode_stream(stream))
+    return _gcode_payload(scan_gcode_regions(StreamRegions(stream)))
+
+register_dialect("orca", lambda head: b"OrcaSlicer" in head)(_parse_text_gcode)
+register_dialect("bambu", lambda head: b"HEADER_BLOCK_START" in head)(_parse_text_gcode)
+register_dialect("superslicer", lambda head: b"generated by SuperSlicer" in head)(_parse_text_gcode)
+register_dialect("prusaslicer", lambda head: b"generated by PrusaSlicer" in head)(_parse_text_gcode)
+
+@register_dialect("cura", lambda head: b";Generated with Cura" in head or (b";FLAVOR:" in head and b";Filament used:" in head))
+def _parse_cura(stream: BinaryIO) -> dict:
+    """
+    Cura writes its estimate at the top of the file, with lengths in metres:
+    ;TIME:6666
+    ;Filament used: 2.2349m, 0.5m
+    Grams are derived from the length assuming CURA_FILAMENT_DIAMETER_MM and DEFAULT_FILAMENT_DENSITY.
+    """
+    header, _ = read_header(stream, CURA_HEADER_BYTES)
+    metadata = GcodeMetadata()
+    match = re.search(rb";Filament used:[ \t]*([^\r\n]*)", header)
     if match:
+        metres = re.findall(rb"([\d.]+)\s*m", match.group(1))
+        metadata.lengths_mm = [round(float(m) * 1000, 2) for m in metres]
+        cross_section_mm2 = math.pi * (CURA_FILAMENT_DIAMETER_MM / 2) ** 2
+        metadata.volumes_cm3 = [round(mm * cross_section_mm2 / 1000, 2) for mm in metadata.lengths_mm]
+        metadata.weights_g = [round(cm3 * DEFAULT_FILAMENT_DENSITY, 2) for cm3 in metadata.volumes_cm3]
+    match = re.search(rb";TIME:(\d+)", header)
+    if match:
+        metadata.print_time_s = int(match.group(1))
+    return _gcode_payload(metadata)
+
+@register_dialect("bgcode", lambda head: head.startswith(BGCODE_MAGIC))
+def _parse_bgcode(stream: BinaryIO) -> dict:
+    """
+    Binary G-code (PrusaSlicer and forks): a 10 byte file header followed by blocks of
+        type u16 | compression u16 | uncompressed size u32 | [compressed size u32]
+        | parameters | data | [crc32]
+    Only the small metadata blocks are read; thumbnails, the slicer config and the
+    G-code blocks are skipped by seeking past them, so the toolpath is never decompressed.
+    """
+    found: Dict[str, bytes] = {}
+    header = stream.read(10)
+    if len(header) < 10:
+        return _gcode_payload(GcodeMetadata())
+    _, _, checksum_type = struct.unpack("<4sIH", header)
+    checksum_size = 4 if checksum_type == 1 else 0
+
+    while True:
+        block_header = stream.read(8)
+        if len(block_header) < 8:
+            break
+        block_type, compression, uncompressed_size = struct.unpack("<HHI", block_header)
+        data_size = uncompressed_size
+        if compression != BGCODE_COMPRESSION_NONE:
+            compressed_size = stream.read(4)
+            if len(compressed_size) < 4:
+                break
+            data_size = struct.unpack("<I", compressed_size)[0]
+        params_size = 6 if block_type == BGCODE_BLOCK_THUMBNAIL else 2
+
+        if block_type == BGCODE_BLOCK_GCODE and any(key in found for key in WEIGHT_KEYS):
+            # Metadata always precedes the toolpath; nothing useful is left
+            break
+        if block_type in BGCODE_METADATA_BLOCKS:
+            stream.seek(params_size, io.SEEK_CUR)
+            data = _bgcode_block_data(stream.read(data_size), compression)
+            if data:
+                # Metadata is INI style "key=value" lines; comment them so the G-code scanner applies
+                scan_metadata(b"\n".join(b"; " + line for line in data.splitlines()), found)
+            stream.seek(checksum_size, io.SEEK_CUR)
+        else:
+            stream.seek(params_size + data_size + checksum_size, io.SEEK_CUR)
+
+    return _gcode_payload(metadata_from_matches(found))
+
+def _bgcode_block_data(data: bytes, compression: int) -> Optional[bytes]:
+    if compression == BGCODE_COMPRESSION_NONE:
+        return data
+    if compression == BGCODE_COMPRESSION_DEFLATE:
         try:
-            weights_str = match.group(1).strip()
-            weights = [float(w.strip()) for w in weights_str.split(",") if w.strip()]
-            # If at least one weight is > 0, return it
-            if any(w > 0 for w in weights):
-                return weights
-        except ValueError:
-            pass
-
-    # Pattern 2: Some newer Bambu Studio versions use separate lines or differ slightly
-    # ; total filament used [g] = 23.4
-    match_total = re.search(r";\s*total filament used\s*\[g\]\s*=\s*([\d\.]+)", text)
-    if match_total:
-        try:
-            return [float(match_total.group(1))]
-        except ValueError:
-            pass
-
-    # Pattern 3: Bambu Studio "total filament weight [g] :"
-    # ; total filament weight [g] : 2.58,0.97
-    match_weight = re.search(r";\s*total filament weight\s*\[g\]\s*[:=]\s*(.*)", text)
-    if match_weight:
-        try:
-            weights_str = match_weight.group(1).strip()
-            weights = [float(w.strip()) for w in weights_str.split(",") if w.strip()]
-            if any(w > 0 for w in weights):
-                return weights
-        except ValueError:
-            pass
-            
-    # Pattern 4: Look for "filament_used_g" config value often found in 3mf slice_info
-    # filament_used_g = 12.4
-    match_config = re.findall(r"filament_used_g\s*=\s*([\d\.]+)", text)
-    if match_config:
-        try:
-            # This might match multiple times for multiple plates/objects, 
-            # but usually in slice_info it appears as a list or sequence
-            # Let's try to find the list version first
-            pass 
-        except:
-            pass
+            return zlib.decompress(data)
+        except zlib.error:
+            return None
+    # Heatshrink is only used for G-code blocks by the slicers we know of
+    return None
 
-    return []
+# Unknown slicer: the same tail first scan, which ends up covering the whole file if need be
+register_dialect("gcode", lambda head: b"\0" not in head)(_parse_text_gcode)
+
+def parse_gcode(content: bytes) -> List[float]:
+    return parse_gcode_stream(io.BytesIO(content))
 
-def parse_3mf(content: bytes) -> List[float]:
+def parse_gcode_stream(stream: BinaryIO, size: Optional[int] = None) -> List[float]:
+    return scan_gcode_stream(stream, size).weights_g
+
+def scan_gcode_stream(stream: BinaryIO, size: Optional[int] = None) -> GcodeMetadata:
+    """
+    Extracts the slicer estimates from a G-code stream without loading it into memory;
+    used for streams that are expensive or impossible to seek, such as G-code members
+    inside a 3MF (zipfile can seek them, but only by decompressing from the start again).
+    Only the header block and the last TAIL_SCAN_BYTES are scanned, read in one forward
+    pass; pass the stream's `size` when it is known (ZipInfo.file_size for 3MF members).
+    The rest of the file is read chunk by chunk only if neither contains filament weights.
     """
-    Attempts to find slice info in 3MF metadata.
-    Bambu Studio 3MFs usually contain a 'Metadata/slice_info.config' 
-    or sometimes 'Metadata/project_settings.config'
+    found: Dict[str, bytes] = {}
+    header, head_end = read_header(stream)
+    scan_metadata(header, found)
+    scan_metadata(read_tail(stream, head_end, size), found)
+
+    seekable = stream.seekable()
+    metadata = metadata_from_matches(found)
+    if metadata.weights_g or not seekable:
+        return metadata
+
+    # Unusual layout: fall back to a pass over the whole file
+    scan_chunks(stream, head_end, found)
+    return metadata_from_matches(found)
+
+def scan_chunks(stream: BinaryIO, start: int, found: Dict[str, bytes], end: Optional[int] = None):
+    """Scans a seekable stream from `start` to `end` (default the end) in line aligned chunks."""
+    position = stream.seek(start)
+    carry = b""
+    while end is None or position < end:
+        chunk = stream.read(CHUNK_SIZE if end is None else min(CHUNK_SIZE, end - position))
+        if not chunk:
+            break
+        position += len(chunk)
+        chunk = carry + chunk
+        cut = chunk.rfind(b"\n") + 1
+        scan_metadata(chunk[:cut], found)
+        carry = chunk[cut:]
+    scan_metadata(carry, found)
+
+def read_header(stream: BinaryIO, limit: int = HEAD_SCAN_BYTES):
+    """
+    Reads the header block (Bambu/Orca: "; HEADER_BLOCK_START" ... "; HEADER_BLOCK_END"),
+    or the first `limit` bytes when there is none, from the start of the stream.
+    Returns the header and the offset just past it.
+    """
+    head = []
+    head_end = 0
+    while head_end < limit:
+        line = stream.readline(limit)
+        if not line:
+            break
+        head.append(line)
+        head_end += len(line)
+        if b"HEADER_BLOCK_END" in line:
+            break
+    return b"".join(head), head_end
+
+def read_tail(stream: BinaryIO, head_end: int, size: Optional[int] = None) -> bytes:
     """
+    Returns the last TAIL_SCAN_BYTES of the stream (never anything before `head_end`),
+    starting at a line boundary. With `size`, the stream is read forward from `head_end`
+    and the bytes before the tail are skipped. Otherwise a seekable stream seeks to the
+    tail, and any other stream is read to the end keeping a rolling tail.
+    """
+    if size is not None or stream.seekable():
+        if size is None:
+            size = stream.seek(0, io.SEEK_END)
+            tail_start = max(head_end, size - TAIL_SCAN_BYTES)
+            stream.seek(tail_start)
+        else:
+            tail_start = max(head_end, size - TAIL_SCAN_BYTES)
+            skip_forward(stream, tail_start - head_end)
+        tail = stream.read()
+        if tail_start > head_end:
+            # Drop the partial line we landed in
+            tail = tail.split(b"\n", 1)[-1]
+        return tail
+
+    tail = b""
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        tail = (tail + chunk)[-TAIL_SCAN_BYTES:]
+    return tail.split(b"\n", 1)[-1]
+
+def skip_forward(stream: BinaryIO, count: int):
+    while count > 0:
+        skipped = len(stream.read(min(CHUNK_SIZE, count)))
+        if not skipped:
+            break
+        count -= skipped
+
+def scan_metadata(block, found: Dict[str, bytes], start: int = 0, end: Optional[int] = None):
+    """
+    Single pass over `block` (bytes or an mmap, optionally only block[start:end]),
+    recording the first value of every metadata key in `found`.
+    """
+    for match in METADATA_RE.finditer(block, start, len(block) if end is None else end):
+        for key in METADATA_KEYS:
+            if match.group(key) is not None:
+                if key not in found:
+                    found[key] = match.group("value")
+                break
+
+def metadata_from_matches(found: Dict[str, bytes]) -> GcodeMetadata:
+    metadata = GcodeMetadata(
+        lengths_mm=_float_list(found.get("filament_used_mm")),
+        volumes_cm3=_float_list(found.get("filament_used_cm3")),
+        costs=_float_list(found.get("filament_cost")),
+        print_time_s=_duration_seconds(found.get("print_time")),
+        colors=_str_list(found.get("filament_colour")),
+        types=_str_list(found.get("filament_type")),
+    )
+    total_cost = _float_list(found.get("total_filament_cost"))
+    if total_cost:
+        metadata.total_cost = total_cost[0]
+
+    for key in WEIGHT_KEYS:
+        weights = _float_list(found.get(key))
+        if key == "total_filament_used_g":
+            # A single total, returned even when it is zero
+            if weights:
+                metadata.weights_g = weights[:1]
+                break
+        elif any(w > 0 for w in weights):
+            metadata.weights_g = weights
+            break
+    return metadata
+
+def _float_list(value: Optional[bytes]) -> List[float]:
+    if not value:
+        return []
     try:
-        with zipfile.ZipFile(io.BytesIO(content)) as z:
-            # 1. Try slice_info.config (most common for sliced files)
-            for name in z.namelist():
-                if name.endswith("slice_info.config"):
-                    with z.open(name) as f:
-                        return parse_gcode(f.read())
-            
-            # 2. Try G-code files directly if they exist in the 3mf (less common for project files)
-            for name in z.namelist():
-                if name.endswith(".gcode"):
-                    with z.open(name) as f:
-                        return parse_gcode(f.read())
+        return [float(v) for v in value.decode("utf-8", errors="ignore").split(",") if v.strip()]
+    except ValueError:
+        return []
+
+def _str_list(value: Optional[bytes]) -> List[str]:
+    if not value:
+        return []
+    return [v.strip().strip('"') for v in value.decode("utf-8", errors="ignore").split(";")]
+
+def _duration_seconds(value: Optional[bytes]) -> Optional[int]:
+    """'1d 2h 3m 4s' -> seconds"""
+    if not value:
+        return None
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    parts = re.findall(rb"(\d+)\s*([dhms])", value)
+    if not parts:
+        return None
+    return sum(int(amount) * units[unit.decode()] for amount, unit in parts)
+
+def parse_3mf(source: Union[bytes, BinaryIO]) -> List[float]:
+    """
+    Returns the weights (in grams) per filament slot for the whole 3MF,
+    summed over all of its plates.
+    """
+    return sum_plate_weights(parse_3mf_plates(source))
+
+def parse_3mf_plates(source: Union[bytes, BinaryIO]) -> List[PlateUsage]:
+    """
+    Reads per-plate filament usage from a 3MF.
+    Sliced Bambu Studio/Orca 3MFs carry it in 'Metadata/slice_info.config', which is
+    tiny, so the plate G-code members (often hundreds of MB each) are only opened
+    when that file is missing or has no usage in it.
+    `source` can be the raw bytes or a seekable file object, which zipfile reads in place.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        with zipfile.ZipFile(source) as z:
+            slice_info = None
+            gcode_members = []
+            for info in z.infolist():
+                if info.filename == SLICE_INFO_MEMBER or (slice_info is None and info.filename.endswith("slice_info.config")):
+                    slice_info = info
+                elif info.filename.endswith(".gcode"):
+                    gcode_members.append(info)
+
+            # 1. slice_info.config (most common for sliced files)
+            if slice_info is not None:
+                with z.open(slice_info) as f:
+                    plates = _plates_from_slice_info(f)
+                if plates:
+                    return plates
+
+            # 2. G-code files embedded in the 3mf, one per plate
+            plates = []
+            for number, info in enumerate(gcode_members, 1):
+                match = re.search(r"plate_(\d+)\.gcode$", info.filename)
+                with z.open(info) as f:
+                    weights = parse_gcode_stream(f, info.file_size)
+                if weights:
+                    plates.append(PlateUsage(index=int(match.group(1)) if match else number, weights_g=weights))
+            return plates
 
     except Exception:
         pass
     return []
 
+def _plates_from_slice_info(f: BinaryIO) -> List[PlateUsage]:
+    """
+    slice_info.config lists each sliced plate with its filaments:
+    <plate>
+      <metadata key="index" value="1"/>
+      <filament id="1" type="PLA" color="#FFFFFF" used_m="5.31" used_g="16.08"/>
+    </plate>
+    Filament ids are 1-based AMS/extruder slots.
+    """
+    plates = []
+    root = ET.parse(f).getroot()
+    for number, plate in enumerate(root.iter("plate"), 1):
+        index = number
+        for meta in plate.findall("metadata"):
+            if meta.get("key") == "index":
+                index = int(meta.get("value", number))
+
+        slot_weights = {}
+        slot_filaments = {}
+        for filament in plate.findall("filament"):
+            slot = int(filament.get("id", 0))
+            if slot > 0:
+                slot_weights[slot] = slot_weights.get(slot, 0.0) + float(filament.get("used_g") or 0)
+                slot_filaments[slot] = filament
+        if not slot_weights:
+            continue
+
+        slots = max(slot_weights)
+        weights = [0.0] * slots
+        colors = [""] * slots
+        types = [""] * slots
+        for slot, grams in slot_weights.items():
+            weights[slot - 1] = grams
+            colors[slot - 1] = slot_filaments[slot].get("color", "")
+            types[slot - 1] = slot_filaments[slot].get("type", "")
+        plates.append(PlateUsage(index=index, weights_g=weights, colors=colors, types=types))
+    return plates
+
+def sum_plate_weights(plates: List[PlateUsage]) -> List[float]:
+    totals: List[float] = []
+    for plate in plates:
+        for slot, grams in enumerate(plate.weights_g):
+            if slot == len(totals):
+                totals.append(0.0)
+            totals[slot] += grams
+    return [round(w, 2) for w in totals]
 
+def merge_plate_slots(plates: List[PlateUsage], attribute: str) -> List[str]:
+    """Per-slot colors or types over all plates; the first plate that uses a slot names it."""
+    merged: List[str] = []
+    for plate in plates:
+        for slot, value in enumerate(getattr(plate, attribute)):
+            if slot == len(merged):
+                merged.append("")
+            merged[slot] = merged[slot] or value
+    return merged
@@ -0,0 +1,218 @@
+"""
+Synthetic print files for the parser benchmarks.
+
+G-code files are padded with toolpath moves up to the requested size and carry
+one of the metadata variants that app.utils understands, in the place the
+respective slicer writes it: a Bambu Studio header block, a PrusaSlicer footer
+followed by its config block, or Cura's header-only comments. 3MF files mimic a sliced Bambu Studio project:
+a Metadata/slice_info.config plus one embedded G-code member per plate.
+Binary G-code files follow the PrusaSlicer block layout with uncompressed G-code blocks.
+"""
+import math
+import os
+import random
+import struct
+import zipfile
+import zlib
+from typing import List
+
+MB = 1024 * 1024
+
+# variant -> where the slicer writes the usage line
+GCODE_VARIANTS = {
+    # PrusaSlicer / Bambu footer: ; filament used [g] = 23.4, 10.1, 0
+    "filament_used": "footer",
+    # ; total filament used [g] = 23.4
+    "total_filament_used": "footer",
+    # Bambu Studio header block: ; total filament weight [g] : 2.58,0.97
+    "total_filament_weight": "header",
+    # Config style key: ; filament_used_g = 12.4
+    "filament_used_g": "footer",
+    # PrusaSlicer: usage footer, then a ~40 KB "; prusaslicer_config = begin" block
+    "prusaslicer": "footer",
+    # PrusaSlicer with a config block longer than the tail window, so the usage is
+    # only found by the parser's wider fallback scans
+    "prusaslicer_long_config": "footer",
+    # Cura: ;Filament used: 2.2349m in the header and nothing at the end
+    "cura": "header",
+}
+
+# Config block sizes of the PrusaSlicer variants, in lines of about 40 bytes
+PRUSA_CONFIG_LINES = {"prusaslicer": 1000, "prusaslicer_long_config": 20000}
+
+# Cura only writes lengths; the parser converts them like this (see utils._parse_cura)
+CURA_FILAMENT_DIAMETER_MM = 1.75
+CURA_FILAMENT_DENSITY = 1.24
+VARIANTS = list(GCODE_VARIANTS) + ["3mf", "bgcode"]
+
+
+def expected_weights(variant: str, filaments: int, seed: int = 0) -> List[float]:
+    """The weights (grams per slot) written into a generated file."""
+    rng = random.Random(seed)
+    weights = [round(rng.uniform(1, 250), 2) for _ in range(filaments)]
+    if variant == "total_filament_used":
+        return [round(sum(weights), 2)]
+    if variant == "cura":
+        cross_section_mm2 = math.pi * (CURA_FILAMENT_DIAMETER_MM / 2) ** 2
+        volumes = [round(metres * 1000 * cross_section_mm2 / 1000, 2) for metres in _cura_metres(weights)]
+        return [round(cm3 * CURA_FILAMENT_DENSITY, 2) for cm3 in volumes]
+    return weights
+
+
+def _cura_metres(weights: List[float]) -> List[float]:
+    """Filament lengths, as Cura writes them (4 decimals), close to the given weights."""
+    grams_per_metre = math.pi * (CURA_FILAMENT_DIAMETER_MM / 2) ** 2 * CURA_FILAMENT_DENSITY
+    return [round(grams / grams_per_metre, 4) for grams in weights]
+
+
+def _usage_line(variant: str, weights: List[float]) -> str:
+    joined = ", ".join(f"{w:.2f}" for w in weights)
+    if variant == "filament_used":
+        return f"; filament used [g] = {joined}\n"
+    if variant == "total_filament_used":
+        return f"; total filament used [g] = {weights[0]:.2f}\n"
+    if variant == "total_filament_weight":
+        return f"; total filament weight [g] : {','.join(f'{w:.2f}' for w in weights)}\n"
+    if variant == "filament_used_g":
+        return f"; filament_used_g = {joined}\n"
+    if variant in PRUSA_CONFIG_LINES:
+        return (f"; filament used [mm] = {', '.join(f'{w * 330:.2f}' for w in weights)}\n"
+                f"; filament used [cm3] = {', '.join(f'{w / 1.24:.2f}' for w in weights)}\n"
+                f"; filament used [g] = {joined}\n"
+                f"; filament cost = {', '.join(f'{w * 0.025:.2f}' for w in weights)}\n"
+                f"; total filament used [g] = {sum(weights):.2f}\n"
+                "; estimated printing time (normal mode) = 1h 26m 31s\n")
+    if variant == "cura":
+        return f";Filament used: {', '.join(f'{m:.4f}m' for m in _cura_metres(weights))}\n"
+    raise ValueError(f"Unknown G-code variant: {variant}")
+
+
+def _toolpath_block(rng: random.Random, size: int = 64 * 1024) -> bytes:
+    lines = []
+    total = 0
+    e = 0.0
+    while total < size:
+        e += rng.uniform(0.01, 0.2)
+        line = f"G1 X{rng.uniform(0, 256):.3f} Y{rng.uniform(0, 256):.3f} E{e:.5f}\n"
+        if rng.random() < 0.01:
+            line += "; FEATURE: Outer wall\n;LAYER_CHANGE\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines).encode()
+
+
+def _prusa_config(lines: int) -> str:
+    rows = [f"; setting_{i:05d} = {(i % 97) / 10:.1f}\n" for i in range(lines)]
+    return "; prusaslicer_config = begin\n" + "".join(rows) + "; prusaslicer_config = end\n"
+
+
+def _gcode_blocks(variant: str, weights: List[float], filaments: int):
+    """The header and footer lines of a G-code file in the variant's slicer layout."""
+    usage = _usage_line(variant, weights)
+    if variant in PRUSA_CONFIG_LINES:
+        header = ["; generated by PrusaSlicer 2.7.1+win64 on 2024-01-15 at 10:12:33 UTC\n\n",
+                  "; external perimeters extrusion width = 0.45mm\n; first layer extrusion width = 0.42mm\n\n"]
+        footer = ["\n", usage, "\n", _prusa_config(PRUSA_CONFIG_LINES[variant])]
+        return header, footer
+    if variant == "cura":
+        header = [";FLAVOR:Marlin\n", ";TIME:5191\n", usage, ";Layer height: 0.2\n",
+                  ";MINX:10.2\n;MINY:12.5\n;MINZ:0.2\n",
+                  ";Generated with Cura_SteamEngine 5.6.0\n", "M140 S60\nM105\n"]
+        return header, [";End of Gcode\n"]
+
+    position = GCODE_VARIANTS[variant]
+    header = ["; HEADER_BLOCK_START\n", "; BambuStudio 01.09.00.70\n",
+              "; model printing time: 1h 20m 5s; total estimated time: 1h 26m 31s\n"]
+    if position == "header":
+        header.append(usage)
+    header.append("; HEADER_BLOCK_END\n\n")
+    footer = ["; EXECUTABLE_BLOCK_END\n", "; filament_density: " + ",".join(["1.24"] * filaments) + "\n"]
+    if position == "footer":
+        footer.append(usage)
+    footer.append("; CONFIG_BLOCK_START\n; layer_height = 0.2\n; CONFIG_BLOCK_END\n")
+    return header, footer
+
+
+def _write_gcode(f, variant: str, size_bytes: int, filaments: int, seed: int):
+    rng = random.Random(seed)
+    # Cura files are described by their lengths, so they start from the plain weights
+    weights = expected_weights("filament_used" if variant == "cura" else variant, filaments, seed)
+    header, footer = _gcode_blocks(variant, weights, filaments)
+
+    head = "".join(header).encode()
+    tail = "".join(footer).encode()
+    f.write(head)
+    block = _toolpath_block(rng)
+    remaining = max(0, size_bytes - len(head) - len(tail))
+    while remaining > 0:
+        chunk = block[:remaining]
+        f.write(chunk)
+        remaining -= len(chunk)
+    # The last block may have been cut mid-line
+    f.write(b"\n")
+    f.write(tail)
+
+
+def _slice_info(plates: int, weights: List[float]) -> str:
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<config>\n  <header>\n'
+             '    <header_item key="X-BBL-Client-Type" value="slicer"/>\n  </header>\n']
+    for plate in range(1, plates + 1):
+        parts.append(f'  <plate>\n    <metadata key="index" value="{plate}"/>\n')
+        for slot, grams in enumerate(weights, 1):
+            parts.append(f'    <filament id="{slot}" type="PLA" color="#FFFFFF" '
+                         f'used_m="{grams / 3:.2f}" used_g="{grams / plates:.4f}"/>\n')
+        parts.append("  </plate>\n")
+    parts.append("</config>\n")
+    return "".join(parts)
+
+
+def _bgcode_block(block_type: int, data: bytes, compression: int = 0) -> bytes:
+    payload = zlib.compress(data) if compression == 1 else data
+    header = struct.pack("<HHI", block_type, compression, len(data))
+    if compression:
+        header += struct.pack("<I", len(payload))
+    body = header + struct.pack("<H", 0) + payload
+    return body + struct.pack("<I", zlib.crc32(body))
+
+
+def _write_bgcode(f, size_bytes: int, filaments: int, seed: int):
+    """PrusaSlicer layout: metadata blocks, thumbnail, config, then 64 KB G-code blocks."""
+    rng = random.Random(seed)
+    weights = expected_weights("filament_used", filaments, seed)
+    joined = ", ".join(f"{w:.2f}" for w in weights)
+    f.write(b"GCDE" + struct.pack("<IH", 1, 1))
+    f.write(_bgcode_block(0, b"Producer=PrusaSlicer 2.7.1\n"))
+    f.write(_bgcode_block(3, f"printer_model=MK4\nfilament used [g]={joined}\n".encode()))
+    thumbnail = struct.pack("<HHI", 5, 0, 1024) + struct.pack("<HHH", 0, 16, 16) + bytes(1024)
+    f.write(thumbnail + struct.pack("<I", zlib.crc32(thumbnail)))
+    f.write(_bgcode_block(4, f"filament used [g]={joined}\nestimated printing time (normal mode)=1h 2m 3s\n".encode()))
+    f.write(_bgcode_block(2, b"; layer_height = 0.2\n" * 2000, compression=1))
+    block = _toolpath_block(rng)
+    written = 0
+    while written < size_bytes:
+        f.write(_bgcode_block(1, block))
+        written += len(block)
+
+
+def generate(path: str, variant: str, size_mb: float, filaments: int = 1, plates: int = 2, seed: int = 0) -> str:
+    """Writes one synthetic file to `path` and returns the path."""
+    size_bytes = int(size_mb * MB)
+    if variant == "3mf":
+        weights = expected_weights("filament_used", filaments, seed)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("Metadata/slice_info.config", _slice_info(plates, weights))
+            for plate in range(1, plates + 1):
+                with z.open(f"Metadata/plate_{plate}.gcode", "w", force_zip64=True) as member:
+                    _write_gcode(member, "filament_used", size_bytes // plates, filaments, seed)
+    elif variant == "bgcode":
+        with open(path, "wb") as f:
+            _write_bgcode(f, size_bytes, filaments, seed)
+    else:
+        with open(path, "wb") as f:
+            _write_gcode(f, variant, size_bytes, filaments, seed)
+    return path
+
+
+def corpus_path(directory: str, variant: str, size_mb: float, filaments: int) -> str:
+    extension = {"3mf": ".3mf", "bgcode": ".bgcode"}.get(variant, ".gcode")
+    return os.path.join(directory, f"{variant}-{size_mb:g}mb-{filaments}f{extension}")
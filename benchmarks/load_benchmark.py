@@ -0,0 +1,187 @@
+"""
+Load benchmark for the sync routes against their /async counterparts.
+
+    python -m benchmarks.load_benchmark --concurrency 50,100,250,500 --duration 10
+    python -m benchmarks.load_benchmark --url http://localhost:8000 --endpoints filaments,stats
+
+Without --url a uvicorn server is started on a fresh SQLite database in a temp
+directory and seeded with --spools spools. Each (endpoint, mode, concurrency) case
+keeps that many clients sending requests back to back for --duration seconds.
+Needs httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ["filaments", "print", "stats"]
+MODES = ["sync", "async"]
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir: str, workers: int):
+    port = _free_port()
+    env = dict(os.environ, FILAMENT_DATABASE_URL="sqlite:///" + os.path.join(workdir, "load.db").replace(os.sep, "/"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=PROJECT_DIR, env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url + "/stats", timeout=1)
+            return process, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not start")
+
+
+def seed(url: str, spools: int) -> list:
+    with httpx.Client(base_url=url, timeout=30) as client:
+        ids = []
+        for i in range(spools):
+            response = client.post("/filament", json={
+                "brand": "Bench", "material": "PLA", "color_name": f"Color {i}", "color_hex": "#336699",
+                "initial_weight": 1000, "remaining_weight": 1000000, "price": 20
+            })
+            response.raise_for_status()
+            ids.append(response.json()["id"])
+    return ids
+
+
+def request_for(endpoint: str, mode: str, spool_ids: list, n: int):
+    prefix = "/async" if mode == "async" else ""
+    if endpoint == "print":
+        body = {"name": f"bench {n}", "filaments_used": [
+            {"filament_id": spool_ids[n % len(spool_ids)], "grams_used": 0.1}
+        ]}
+        return "POST", prefix + "/print", body
+    return "GET", f"{prefix}/{endpoint}", None
+
+
+async def run_case(url: str, endpoint: str, mode: str, concurrency: int, duration: float, spool_ids: list) -> dict:
+    latencies = []
+    errors = 0
+    counter = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors, counter
+            while time.perf_counter() < deadline:
+                counter += 1
+                method, path, body = request_for(endpoint, mode, spool_ids, counter)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "endpoint": endpoint,
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_s": len(latencies) / elapsed,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50) * 1000 if latencies else None,
+            "p99": _percentile(latencies, 99) * 1000 if latencies else None,
+            "mean": statistics.mean(latencies) * 1000 if latencies else None,
+        },
+    }
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one (its data is modified)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started server")
+    parser.add_argument("--concurrency", type=_int_list, default=[50, 100, 250, 500])
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma separated, from: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per case")
+    parser.add_argument("--spools", type=int, default=50)
+    parser.add_argument("--output", default="load_benchmark.json")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        url = args.url
+        if url is None:
+            process, url = start_server(workdir, args.workers)
+        try:
+            spool_ids = seed(url, args.spools)
+            results = []
+            for endpoint in args.endpoints.split(","):
+                for concurrency in args.concurrency:
+                    for mode in args.modes.split(","):
+                        result = asyncio.run(run_case(url, endpoint, mode, concurrency, args.duration, spool_ids))
+                        results.append(result)
+                        latency = result["latency_ms"]
+                        print(f"{endpoint:<10} {mode:<6} {concurrency:>4} clients  "
+                              f"{result['requests_per_s']:8.1f} req/s  "
+                              f"p50 {latency['p50'] or 0:8.1f} ms  p99 {latency['p99'] or 0:8.1f} ms  "
+                              f"{result['errors']} errors")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "url": args.url or "local",
+            "workers": args.workers,
+            "duration_s": args.duration,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
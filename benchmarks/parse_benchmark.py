@@ -0,0 +1,147 @@
+"""
+Throughput benchmark for app.utils.parse_material_usage.
+
+    python -m benchmarks.parse_benchmark --sizes 1,10,100 --filaments 1,4
+    python -m benchmarks.parse_benchmark --output new.json --compare old.json
+
+Synthetic files are generated once into --corpus-dir and reused across runs.
+Each case runs in its own process so the reported peak RSS belongs to that case.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from app import utils
+from benchmarks import corpus
+
+
+def _rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(path: str, filename: str, iterations: int, queue):
+    baseline_rss = _rss_mb()
+    latencies = []
+    weights = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            weights = utils.parse_material_usage(f, filename)
+        latencies.append(time.perf_counter() - start)
+    queue.put({"latencies": latencies, "weights": weights, "baseline_rss_mb": baseline_rss, "peak_rss_mb": _rss_mb()})
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_case(path: str, variant: str, size_mb: float, filaments: int, iterations: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_case, args=(path, os.path.basename(path), iterations, queue))
+    process.start()
+    measured = queue.get()
+    process.join()
+
+    latencies = measured["latencies"]
+    expected = corpus.expected_weights("filament_used" if variant in ("3mf", "bgcode") else variant, filaments)
+    file_mb = os.path.getsize(path) / corpus.MB
+    p50 = _percentile(latencies, 50)
+    return {
+        "variant": variant,
+        "size_mb": size_mb,
+        "file_mb": round(file_mb, 2),
+        "filaments": filaments,
+        "iterations": iterations,
+        "correct": [round(w, 2) for w in measured["weights"]] == expected,
+        "weights": measured["weights"],
+        "latency_ms": {
+            "p50": p50 * 1000,
+            "p90": _percentile(latencies, 90) * 1000,
+            "p99": _percentile(latencies, 99) * 1000,
+            "mean": statistics.mean(latencies) * 1000,
+        },
+        "mb_per_s": file_mb / p50 if p50 > 0 else None,
+        "baseline_rss_mb": round(measured["baseline_rss_mb"], 1),
+        "peak_rss_mb": round(measured["peak_rss_mb"], 1),
+    }
+
+
+def compare(results: list, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["variant"], r["size_mb"], r["filaments"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared to {baseline_path}:")
+    for r in results:
+        old = baseline.get((r["variant"], r["size_mb"], r["filaments"]))
+        if not old:
+            continue
+        speedup = old["latency_ms"]["p50"] / r["latency_ms"]["p50"] if r["latency_ms"]["p50"] else float("inf")
+        print(f"  {r['variant']:<22} {r['size_mb']:>7g} MB {r['filaments']}f  "
+              f"p50 x{speedup:.2f}  peak RSS {old['peak_rss_mb']:.0f} -> {r['peak_rss_mb']:.0f} MB")
+
+
+def _float_list(value: str):
+    return [float(v) for v in value.split(",") if v]
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=_float_list, default=[1, 10, 100], help="File sizes in MB (1 to 1024)")
+    parser.add_argument("--filaments", type=_int_list, default=[1, 4], help="Filament slot counts")
+    parser.add_argument("--variants", default=",".join(corpus.VARIANTS), help="Comma separated, from: " + ", ".join(corpus.VARIANTS))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "filament-parse-corpus"))
+    parser.add_argument("--output", default="parse_benchmark.json")
+    parser.add_argument("--compare", help="Previous --output file to compare against")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.corpus_dir, exist_ok=True)
+    results = []
+    for variant in args.variants.split(","):
+        for size_mb in args.sizes:
+            for filaments in args.filaments:
+                path = corpus.corpus_path(args.corpus_dir, variant, size_mb, filaments)
+                if not os.path.exists(path):
+                    corpus.generate(path, variant, size_mb, filaments)
+                result = run_case(path, variant, size_mb, filaments, args.iterations)
+                results.append(result)
+                print(f"{variant:<22} {size_mb:>7g} MB {filaments}f  "
+                      f"p50 {result['latency_ms']['p50']:9.2f} ms  p99 {result['latency_ms']['p99']:9.2f} ms  "
+                      f"{result['mb_per_s'] or 0:10.0f} MB/s  peak RSS {result['peak_rss_mb']:6.0f} MB  "
+                      f"{'ok' if result['correct'] else 'WRONG'}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parser_version": utils.PARSER_VERSION,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
-import streamlit as st
+import os
+from urllib.parse import quote
 import requests
+import streamlit as st
 import pandas as pd
+from dashboard_client import ApiClient, API_ERRORS
 
-API_URL = "http://localhost:8000"
+# Inventory page size choices; the default can be set with FILAMENT_DASHBOARD_PAGE_SIZE
+PAGE_SIZES = [10, 20, 50, 100]
+DEFAULT_PAGE_SIZE = int(os.environ.get("FILAMENT_DASHBOARD_PAGE_SIZE", 20))
+# Matches fetched from /filaments/search (its maximum); the other filters apply to these
+SEARCH_LIMIT = 200
 
 st.set_page_config(page_title="Bambu Filament Manager", page_icon="🖨️", layout="wide")
 
@@ -227,116 +234,271 @@ page = st.sidebar.radio("Navigate", ["Inventory", "Log Print", "Add Filament", "
 if 'manual_cart' not in st.session_state:
     st.session_state.manual_cart = []
 
-@st.cache_data(ttl=15, show_spinner=False)
-def get_filaments():
+# One client, and so one connection pool, for every session and rerun
+@st.cache_resource
+def get_api() -> ApiClient:
+    return ApiClient()
+
+api = get_api()
+
+def sync_inventory():
+    """
+    Keeps this session's copy of the inventory current. The first call loads every
+    spool; after that only spools changed since the last seen inventory version are
+    fetched, and nothing when the version hasn't moved. Returns the version.
+    """
+    inventory = st.session_state.setdefault("inventory", {"version": 0, "spools": {}})
     try:
-        response = requests.get(f"{API_URL}/filaments")
+        response = api.get_changes(inventory["version"])
         if response.status_code == 200:
-            return response.json()
-    except requests.exceptions.ConnectionError:
+            changes = response.json()
+            for spool in changes["changed"]:
+                inventory["spools"][spool["id"]] = spool
+            for filament_id in changes["deleted"]:
+                inventory["spools"].pop(filament_id, None)
+            inventory["version"] = changes["version"]
+    except API_ERRORS:
         st.error("Could not connect to Backend API. Is it running?")
-        return []
+    return inventory["version"]
+
+def get_filaments():
+    sync_inventory()
+    spools = st.session_state.inventory["spools"]
+    return [spools[filament_id] for filament_id in sorted(spools)]
+
+# Pages are shared by every session and keyed by the inventory version, so they are
+# only fetched again once something has changed. Failures raise, so they aren't cached.
+@st.cache_data(max_entries=500, show_spinner=False)
+def fetch_filament_page(params, cursor, version):
+    query = list(params)
+    if cursor:
+        query.append(("cursor", cursor))
+    response = api.list_filaments(query)
+    if response.status_code != 200:
+        raise requests.HTTPError(response.text, response=response)
+    return response.json(), response.headers.get("X-Next-Cursor"), int(response.headers.get("X-Total-Count", 0))
+
+def get_filament_page(params, cursor, version):
+    """One page of spools, filtered and paged by the API. Returns (spools, next cursor, matching total)."""
+    try:
+        return fetch_filament_page(params, cursor, version)
+    except API_ERRORS:
+        st.error("Could not connect to Backend API. Is it running?")
+    except requests.HTTPError as e:
+        st.error(f"Error: {e}")
+    return [], None, 0
+
+# Ranked search results, cached like the pages above
+@st.cache_data(max_entries=100, show_spinner=False)
+def fetch_filament_search(q, version):
+    response = api.search_filaments(q, SEARCH_LIMIT)
+    if response.status_code != 200:
+        raise requests.HTTPError(response.text, response=response)
+    return response.json()
+
+def search_filaments(q, version):
+    """The best SEARCH_LIMIT matches for `q` (typos and abbreviations such as "blk" work), best first."""
+    try:
+        return fetch_filament_search(q, version)
+    except API_ERRORS:
+        st.error("Could not connect to Backend API. Is it running?")
+    except requests.HTTPError as e:
+        st.error(f"Error: {e}")
     return []
 
+def color_swatch(color_hex):
+    """An SVG data URL of a spool's color (split diagonally for multi-color spools), for image columns."""
+    colors = [c.strip() for c in (color_hex or "#000000").split(",")][:2]
+    second = colors[1] if len(colors) > 1 else colors[0]
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24">'
+        f'<rect width="24" height="24" fill="{colors[0]}"/><path d="M24 0V24H0Z" fill="{second}"/></svg>'
+    )
+    return "data:image/svg+xml;utf8," + quote(svg)
+
+def render_edit_form(f):
+    with st.form(f"edit_form_{f['id']}"):
+        # Editable fields
+        new_brand = st.text_input("Brand", value=f['brand'], key=f"brand_{f['id']}")
+        new_material = st.text_input("Material", value=f['material'], key=f"mat_{f['id']}")
+        new_color_name = st.text_input("Color Name", value=f['color_name'], key=f"cn_{f['id']}")
+
+        new_weight = st.number_input("Current Weight (g)", value=float(f['remaining_weight']), key=f"w_{f['id']}")
+        new_price = st.number_input("Price (NIS)", value=float(f['price']), key=f"p_{f['id']}")
+
+        # Color Editing
+        st.divider()
+        new_is_multicolor = st.checkbox("Multi-color?", value=f.get('is_multicolor', False), key=f"mc_{f['id']}")
+
+        current_hex = f.get('color_hex', '#000000')
+        if not current_hex: current_hex = "#000000"
+
+        new_color_hex = current_hex
+
+        if new_is_multicolor:
+            c_col1, c_col2 = st.columns(2)
+            # Try to parse existing colors
+            colors = ["#FF0000", "#0000FF"]
+            if "," in current_hex:
+                parts = current_hex.split(",")
+                if len(parts) >= 2:
+                    colors = [p.strip() for p in parts[:2]]
+
+            with c_col1:
+                col1 = st.color_picker("Color 1", value=colors[0] if colors[0].startswith("#") else "#FF0000", key=f"c1_{f['id']}")
+            with c_col2:
+                col2 = st.color_picker("Color 2", value=colors[1] if colors[1].startswith("#") else "#0000FF", key=f"c2_{f['id']}")
+            new_color_hex = f"{col1},{col2}"
+        else:
+            # Single color
+            val = current_hex if "," not in current_hex and current_hex.startswith("#") else "#000000"
+            new_color_hex = st.color_picker("Color Hex", value=val, key=f"chex_{f['id']}")
+
+        st.divider()
+
+        update_col, cancel_col = st.columns(2)
+        with update_col:
+            submitted = st.form_submit_button("Update")
+        with cancel_col:
+            cancelled = st.form_submit_button("Cancel")
+
+        if cancelled:
+            st.session_state.editing_id = None
+            st.rerun()
+        if submitted:
+            payload = {
+                "brand": new_brand,
+                "material": new_material,
+                "color_name": new_color_name,
+                "remaining_weight": new_weight,
+                "price": new_price,
+                "color_hex": new_color_hex,
+                "is_multicolor": new_is_multicolor
+            }
+            try:
+                res = api.update_filament(f['id'], payload)
+                if res.status_code == 200:
+                    st.success("Updated!")
+                    st.session_state.editing_id = None
+                    st.rerun()
+                else:
+                    st.error(f"Error: {res.text}")
+            except Exception as e:
+                st.error(f"Conn Error: {e}")
+
 if page == "Inventory":
     st.header("🧵 Filament Inventory")
-    
-    filaments = get_filaments()
-    
-    if not filaments:
+
+    version = sync_inventory()
+    spools = st.session_state.inventory["spools"]
+    all_materials = sorted(set(f['material'] for f in spools.values()))
+    inventory_total = len(spools)
+
+    if not inventory_total:
         st.info("No filaments found. Add some in the 'Add Filament' tab!")
     else:
         # Filters section
         with st.expander("🔍 Filters", expanded=False):
             filter_col1, filter_col2, filter_col3 = st.columns(3)
-            
+
             with filter_col1:
                 st.subheader("Material Type")
-                # Get all unique material types
-                all_materials = sorted(set([f['material'] for f in filaments]))
-                
+
                 # Initialize session state for material filters
                 if 'material_filters' not in st.session_state:
                     st.session_state.material_filters = {mat: True for mat in all_materials}
-                
+
                 # Create checkboxes for each material type
                 selected_materials = []
                 for material in all_materials:
                     checked = st.checkbox(
-                        material, 
+                        material,
                         value=st.session_state.material_filters.get(material, True),
                         key=f"filter_mat_{material}"
                     )
                     st.session_state.material_filters[material] = checked
                     if checked:
                         selected_materials.append(material)
-            
+
             with filter_col2:
                 st.subheader("Stock Status")
                 show_low_stock = st.checkbox("Show Low Stock Only (< 100g)")
                 show_empty = st.checkbox("Show Empty (0g)")
-            
+
             with filter_col3:
                 st.subheader("Search")
-                search_text = st.text_input("Search by brand/color", placeholder="e.g., Generic, black, gold")
-        
-        # Apply filters
-        filtered_filaments = filaments.copy()
-        
-        # Material type filter
-        if selected_materials:
-            filtered_filaments = [f for f in filtered_filaments if f['material'] in selected_materials]
-        
-        # Low stock filter
+                search_text = st.text_input("Search by brand/color/material", placeholder="e.g., Generic, blk, matte wht")
+                page_size = st.selectbox(
+                    "Spools per page", PAGE_SIZES,
+                    index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE) if DEFAULT_PAGE_SIZE in PAGE_SIZES else 0
+                )
+
+        # Filtering and paging happen in the API; only the visible page is fetched and rendered
+        material_filter = selected_materials if selected_materials and len(selected_materials) < len(all_materials) else None
+        params = [("limit", page_size), ("sort", "id")]
+        if material_filter:
+            params += [("material", m) for m in material_filter]
         if show_low_stock:
-            filtered_filaments = [f for f in filtered_filaments if f['remaining_weight'] < 100]
-        
-        # Empty filter
+            params.append(("low_stock", "true"))
         if not show_empty:
-            filtered_filaments = [f for f in filtered_filaments if f['remaining_weight'] > 0]
-        
-        # Search filter
+            params.append(("exclude_empty", "true"))
+        params = tuple(params)
+        search_text = search_text.strip()
+
+        # Cursors of the pages visited so far; a filter change starts again at page 1
+        if st.session_state.get("inventory_params") != (params, search_text):
+            st.session_state.inventory_params = (params, search_text)
+            st.session_state.inventory_cursors = [None]
+        cursors = st.session_state.inventory_cursors
+        page_index = len(cursors) - 1
+
         if search_text:
-            search_lower = search_text.lower()
-            filtered_filaments = [
-                f for f in filtered_filaments 
-                if search_lower in f['brand'].lower() 
-                or search_lower in f['color_name'].lower()
-                or search_lower in f['material'].lower()
+            # Ranked matches from /filaments/search, narrowed by the other filters and paged
+            # here; the cursors are offsets into the matches
+            matches = [
+                f for f in search_filaments(search_text, version)
+                if (not material_filter or f['material'] in material_filter)
+                and (not show_low_stock or f['remaining_weight'] < 100)
+                and (show_empty or f['remaining_weight'] > 0)
             ]
-        
+            start = cursors[-1] or 0
+            filaments = matches[start:start + page_size]
+            next_cursor = start + page_size if len(matches) > start + page_size else None
+            matching_total = len(matches)
+        else:
+            # Keyset cursors from the API
+            filaments, next_cursor, matching_total = get_filament_page(params, cursors[-1], version)
+
         # Show filter results count
-        if len(filtered_filaments) != len(filaments):
-            st.info(f"Showing {len(filtered_filaments)} of {len(filaments)} filaments")
-        
-        filaments = filtered_filaments
-        
+        if matching_total != inventory_total:
+            st.info(f"Showing {matching_total} of {inventory_total} filaments")
+
         if not filaments:
             st.warning("No filaments match the selected filters.")
         else:
             # Grid layout - 5 columns
             num_cols = 5
             cols = st.columns(num_cols)
-            
+
             for idx, f in enumerate(filaments):
                 col_idx = idx % num_cols
                 with cols[col_idx]:
                     # Visual Color Box Logic
                     color_hex = f.get('color_hex', '#000000')
                     if not color_hex: color_hex = "#000000"
-                    
+
                     if "," in color_hex:
                         colors = color_hex.split(",")
                         bg_style = f"background: linear-gradient(45deg, {colors[0]} 50%, {colors[1]} 50%);"
                     else:
                         bg_style = f"background-color: {color_hex};"
-                    
+
                     # Weight info
                     remaining = f['remaining_weight']
                     initial = f['initial_weight']
                     progress = max(0.0, min(1.0, remaining / initial))
                     percentage = int(progress * 100)
-                    
+
                     # Card wrapper - single seamless container
                     with st.container():
                         st.markdown(
@@ -347,81 +509,40 @@ if page == "Inventory":
                             """,
                             unsafe_allow_html=True
                         )
-                        
+
                         st.markdown(f"**{f['brand']} {f['material']}**")
                         # Put color name and multi-color indicator on same line
                         multicolor_indicator = " 🌈 Multi-color" if f.get('is_multicolor') else ""
                         st.caption(f"{f['color_name']}{multicolor_indicator}")
-                        
+
                         st.progress(progress)
                         st.caption(f"{remaining:.0f}g / {initial:.0f}g")
                         st.caption(f"ID: {f['id']} | {f['price']:.0f} ₪")
-                        
-                        # Edit button (inside container)
-                        with st.expander("✏️ Edit", expanded=False):
-                            with st.form(f"edit_form_{f['id']}"):
-                                # Editable fields
-                                new_brand = st.text_input("Brand", value=f['brand'], key=f"brand_{f['id']}")
-                                new_material = st.text_input("Material", value=f['material'], key=f"mat_{f['id']}")
-                                new_color_name = st.text_input("Color Name", value=f['color_name'], key=f"cn_{f['id']}")
-                                
-                                new_weight = st.number_input("Current Weight (g)", value=float(remaining), key=f"w_{f['id']}")
-                                new_price = st.number_input("Price (NIS)", value=float(f['price']), key=f"p_{f['id']}")
-                                
-                                # Color Editing
-                                st.divider()
-                                new_is_multicolor = st.checkbox("Multi-color?", value=f.get('is_multicolor', False), key=f"mc_{f['id']}")
-                                
-                                current_hex = f.get('color_hex', '#000000')
-                                if not current_hex: current_hex = "#000000"
-                                
-                                new_color_hex = current_hex
-
-                                if new_is_multicolor:
-                                    c_col1, c_col2 = st.columns(2)
-                                    # Try to parse existing colors
-                                    colors = ["#FF0000", "#0000FF"]
-                                    if "," in current_hex:
-                                        parts = current_hex.split(",")
-                                        if len(parts) >= 2:
-                                            colors = [p.strip() for p in parts[:2]]
-                                    
-                                    with c_col1:
-                                        col1 = st.color_picker("Color 1", value=colors[0] if colors[0].startswith("#") else "#FF0000", key=f"c1_{f['id']}")
-                                    with c_col2:
-                                        col2 = st.color_picker("Color 2", value=colors[1] if colors[1].startswith("#") else "#0000FF", key=f"c2_{f['id']}")
-                                    new_color_hex = f"{col1},{col2}"
-                                else:
-                                    # Single color
-                                    val = current_hex if "," not in current_hex and current_hex.startswith("#") else "#000000"
-                                    new_color_hex = st.color_picker("Color Hex", value=val, key=f"chex_{f['id']}")
-                                
-                                st.divider()
-
-                                if st.form_submit_button("Update"):
-                                    payload = {
-                                        "brand": new_brand,
-                                        "material": new_material,
-                                        "color_name": new_color_name,
-                                        "remaining_weight": new_weight,
-                                        "price": new_price,
-                                        "color_hex": new_color_hex,
-                                        "is_multicolor": new_is_multicolor
-                                    }
-                                    try:
-                                        res = requests.put(f"{API_URL}/filament/{f['id']}", json=payload)
-                                        if res.status_code == 200:
-                                            st.success("Updated!")
-                                            st.cache_data.clear()
-                                            st.rerun()
-                                        else:
-                                            st.error(f"Error: {res.text}")
-                                    except Exception as e:
-                                        st.error(f"Conn Error: {e}")
-                        
+
+                        # The edit form is only built for the spool being edited
+                        if st.session_state.get("editing_id") == f['id']:
+                            render_edit_form(f)
+                        elif st.button("✏️ Edit", key=f"edit_{f['id']}"):
+                            st.session_state.editing_id = f['id']
+                            st.rerun()
+
                         # Card wrapper - end (close content div and outer div)
                         st.markdown("</div></div>", unsafe_allow_html=True)
 
+            # Pagination
+            page_count = max(1, -(-matching_total // page_size))
+            prev_col, info_col, next_col = st.columns([1, 3, 1])
+            with prev_col:
+                if st.button("◀ Previous", disabled=page_index == 0):
+                    cursors.pop()
+                    st.rerun()
+            with info_col:
+                st.caption(f"Page {page_index + 1} of {page_count}")
+            with next_col:
+                if st.button("Next ▶", disabled=not next_cursor):
+                    cursors.append(next_cursor)
+                    st.rerun()
+
 elif page == "Add Filament":
     st.header("➕ Add New Spool")
     
@@ -462,10 +583,9 @@ elif page == "Add Filament":
                 "is_multicolor": is_multicolor 
             }
             try:
-                res = requests.post(f"{API_URL}/filament", json=payload)
+                res = api.create_filament(payload)
                 if res.status_code == 200:
                     st.success(f"Added {brand} {material} successfully!")
-                    st.cache_data.clear()
                 else:
                     st.error(f"Error: {res.text}")
             except Exception as e:
@@ -477,243 +597,169 @@ elif page == "Log Print":
     filaments = get_filaments()
     filament_map = {f['id']: f for f in filaments}
     
-    # Initialize assignment state
-    if 'slot_assignments' not in st.session_state:
-        st.session_state.slot_assignments = {}
-    if 'active_slot_index' not in st.session_state:
-        st.session_state.active_slot_index = 0
-    
     tab1, tab2 = st.tabs(["📂 From File (Auto)", "✍️ Visual Selector (Manual)"])
     
     with tab1:
-        st.info("Upload a .3mf or .gcode file to automatically extract filament usage.")
-        uploaded_file = st.file_uploader("Choose a file", type=['gcode', '3mf'])
+        st.info("Upload a .3mf, .gcode or .bgcode file to automatically extract filament usage.")
+        # Bumped after each logged print so the uploader starts empty and the job can't be logged twice
+        if 'file_upload_run' not in st.session_state:
+            st.session_state.file_upload_run = 0
+        if 'file_print_logged' in st.session_state:
+            st.success(st.session_state.pop('file_print_logged'))
+
+        uploaded_file = st.file_uploader(
+            "Choose a file", type=['gcode', 'bgcode', '3mf'],
+            key=f"file_upload_{st.session_state.file_upload_run}"
+        )
         
         if uploaded_file is not None:
-            # Cache parse result
-            if 'parse_result' not in st.session_state or st.session_state.get('last_uploaded_file') != uploaded_file.name:
-                files = {"file": (uploaded_file.name, uploaded_file, "application/octet-stream")}
+            # Parse once per upload (file_id changes even when a file of the same name is
+            # uploaded again); the dry run also suggests a spool for every slot
+            if st.session_state.get('file_print_id') != uploaded_file.file_id:
+                st.session_state.file_print = None
                 try:
                     with st.spinner("Parsing file metadata..."):
-                        res = requests.post(f"{API_URL}/parse-file", files=files)
-                    
+                        res = api.log_print_from_file(uploaded_file.name, uploaded_file.getvalue(), dry_run=True)
                     if res.status_code == 200:
-                        data = res.json()
-                        st.session_state.parse_result = data.get("estimated_weights_g", [])
-                        st.session_state.last_uploaded_file = uploaded_file.name
-                        # Reset assignments on new file
-                        st.session_state.slot_assignments = {}
-                        st.session_state.active_slot_index = 0
+                        st.session_state.file_print = res.json()
+                        st.session_state.file_print_id = uploaded_file.file_id
                     else:
-                        st.session_state.parse_result = []
+                        st.error(f"Error: {res.text}")
                 except Exception as e:
                     st.error(f"Error: {e}")
-                    st.session_state.parse_result = []
 
-            weights = st.session_state.parse_result
+            file_print = st.session_state.get('file_print')
+            slots = file_print["slots"] if file_print else []
             
-            if not weights:
+            if not slots:
                 st.warning("No usage data found.")
             else:
-                job_name = st.text_input("Job Name", value=uploaded_file.name)
-                success = st.checkbox("Print Success?", value=True)
-                
-                st.divider()
-                st.subheader("1. Select Slot to Assign")
-                
-                # Render Slot Targets (Horizontal)
-                cols = st.columns(len(weights))
-                for i, weight in enumerate(weights):
-                    # Determine if this slot is 'active' or 'assigned'
-                    is_active = (i == st.session_state.active_slot_index)
-                    assigned_fid = st.session_state.slot_assignments.get(i)
-                    
-                    # Styling for the slot box
-                    border_color = "#ff4b4b" if is_active else "#444"
-                    bg_color = "#262730" if is_active else "#0e1117"
-                    
-                    assigned_text = "❌ Unassigned"
-                    color_preview_style = "background-color: #333;"
+                spool_ids = [None] + [f['id'] for f in filaments if f['remaining_weight'] > 0]
+
+                def spool_label(filament_id):
+                    if filament_id is None:
+                        return "❌ Choose a spool"
+                    f = filament_map[filament_id]
+                    return f"{f['brand']} - {f['color_name']} ({f['material']}) · {f['remaining_weight']:.0f}g left"
+
+                # A form, so choosing spools doesn't rerun the page; the job is logged in one request
+                with st.form("file_print_form"):
+                    job_name = st.text_input("Job Name", value=uploaded_file.name)
+                    success = st.checkbox("Print Success?", value=True)
+                    st.divider()
                     
-                    if assigned_fid and assigned_fid in filament_map:
-                        f = filament_map[assigned_fid]
-                        assigned_text = f"✅ {f['brand']} {f['color_name']}"
-                        # Color Hex Logic
-                        hex_code = f.get('color_hex', '#000000')
-                        if "," in hex_code:
-                            colors = hex_code.split(",")
-                            color_preview_style = f"background: linear-gradient(45deg, {colors[0]} 50%, {colors[1]} 50%);"
-                        else:
-                            color_preview_style = f"background-color: {hex_code};"
+                    assignments = {}
+                    cols = st.columns(len(slots))
+                    for col, slot in zip(cols, slots):
+                        with col:
+                            file_color = slot['color'] or "#333"
+                            st.markdown(
+                                f"""
+                                <div style="border: 2px solid #444; background-color: #0e1117; border-radius: 8px; padding: 10px; text-align: center; margin-bottom: 10px;">
+                                    <div style="font-weight: bold; font-size: 1.1em;">Slot {slot['slot']}</div>
+                                    <div style="font-size: 1.5em; margin: 5px 0;">{slot['grams']}g</div>
+                                    <div style="background-color: {file_color}; width: 100%; height: 10px; border-radius: 2px; margin: 5px 0;"></div>
+                                    <div style="font-size: 0.8em; color: #aaa;">{slot['material'] or "Unknown material"}</div>
+                                </div>
+                                """,
+                                unsafe_allow_html=True
+                            )
+                            suggested = slot['filament_id'] if slot['filament_id'] in spool_ids else None
+                            assignments[slot['slot']] = st.selectbox(
+                                "Spool", spool_ids, index=spool_ids.index(suggested),
+                                format_func=spool_label, key=f"file_slot_{slot['slot']}"
+                            )
+                            if slot['suggested'] and assignments[slot['slot']] == suggested:
+                                st.caption("✨ Suggested by color and material")
                     
-                    with cols[i]:
-                        # Make it look like a card
-                        st.markdown(
-                            f"""
-                            <div style="
-                                border: 2px solid {border_color}; 
-                                background-color: {bg_color};
-                                border-radius: 8px; 
-                                padding: 10px; 
-                                text-align: center;
-                                cursor: pointer;
-                                margin-bottom: 10px;
-                            ">
-                                <div style="font-weight: bold; font-size: 1.1em;">Slot {i+1}</div>
-                                <div style="font-size: 1.5em; margin: 5px 0;">{weight}g</div>
-                                <div style="{color_preview_style} width: 100%; height: 10px; border-radius: 2px; margin: 5px 0;"></div>
-                                <div style="font-size: 0.8em; color: #aaa;">{assigned_text}</div>
-                            </div>
-                            """, 
-                            unsafe_allow_html=True
-                        )
-                        
-                        # Invisible button to handle selection
-                        if st.button(f"Select Slot {i+1}", key=f"btn_slot_{i}", use_container_width=True):
-                            st.session_state.active_slot_index = i
-                            st.rerun()
+                    submitted = st.form_submit_button("Log Print Job", type="primary")
 
-                st.divider()
-                st.subheader(f"2. Choose Filament for Slot {st.session_state.active_slot_index + 1}")
-                
-                # Render Filament Grid
-                # 4 columns grid
-                grid_cols = st.columns(4)
-                
-                for idx, f in enumerate(filaments):
-                    col = grid_cols[idx % 4]
-                    
-                    # Prepare Color Style
-                    hex_code = f.get('color_hex', '#000000')
-                    if "," in hex_code:
-                        colors = hex_code.split(",")
-                        style = f"background: linear-gradient(45deg, {colors[0]} 50%, {colors[1]} 50%);"
+                if submitted:
+                    if any(filament_id is None for filament_id in assignments.values()):
+                        st.error("Please assign a filament to all slots.")
                     else:
-                        style = f"background-color: {hex_code};"
-                    
-                    with col:
-                        # Visual Card
-                        st.markdown(
-                            f'<div style="{style} width: 100%; height: 20px; border-radius: 4px 4px 0 0; border: 1px solid #555;"></div>',
-                            unsafe_allow_html=True
-                        )
-                        # Button
-                        label = f"{f['brand']} - {f['color_name']}\n({f['material']})"
-                        if st.button(label, key=f"pick_{f['id']}"):
-                            # Assign
-                            st.session_state.slot_assignments[st.session_state.active_slot_index] = f['id']
-                            
-                            # Auto-advance to next slot if available
-                            if st.session_state.active_slot_index < len(weights) - 1:
-                                st.session_state.active_slot_index += 1
-                            st.rerun()
-                
-                st.divider()
-                
-                # Log Print Button
-                # Check if all slots assigned
-                all_assigned = len(st.session_state.slot_assignments) == len(weights)
-                
-                if st.button("Log Print Job", type="primary", disabled=not all_assigned):
-                    usage_payload = []
-                    for i, weight in enumerate(weights):
-                        usage_payload.append({
-                            "filament_id": st.session_state.slot_assignments[i],
-                            "grams_used": weight
-                        })
-                    
-                    print_data = {
-                        "name": job_name,
-                        "success": success,
-                        "filaments_used": usage_payload
-                    }
-                    
-                    try:
-                        r = requests.post(f"{API_URL}/print", json=print_data)
-                        if r.status_code == 200:
-                            st.success("Print logged successfully!")
-                            st.cache_data.clear()
-                            # Clear state
-                            st.session_state.slot_assignments = {}
-                            st.session_state.active_slot_index = 0
-                        else:
-                            st.error(f"Error: {r.text}")
-                    except Exception as e:
-                        st.error(f"Error: {e}")
-                
-                if not all_assigned:
-                    st.caption("Please assign a filament to all slots to enable logging.")
+                        # The dry run already parsed the file, so log its grams per slot
+                        # instead of uploading the file again
+                        payload = {
+                            "name": job_name,
+                            "success": success,
+                            "filaments_used": [
+                                {"filament_id": assignments[slot['slot']], "grams_used": slot['grams']}
+                                for slot in slots
+                            ]
+                        }
+                        try:
+                            r = api.log_print(payload)
+                            if r.status_code == 200:
+                                st.session_state.file_print = None
+                                st.session_state.file_print_id = None
+                                st.session_state.file_upload_run += 1
+                                st.session_state.file_print_logged = "Print logged successfully!"
+                                st.rerun()
+                            else:
+                                st.error(f"Error: {r.text}")
+                        except Exception as e:
+                            st.error(f"Error: {e}")
 
     with tab2:
-        # New Visual Selection Logic - "Spreadsheet Style"
         st.subheader("Enter Grams for Used Filaments")
-        st.caption("Scroll down and enter weight for any filament used. Leave at 0 if not used.")
+        st.caption("Enter the grams used in the Grams column for every spool the print used. Rows left at 0 are ignored.")
+
+        active_only = st.checkbox("Active spools only", value=True, help="Hide empty spools")
+        spools = pd.DataFrame(filaments, columns=["id", "brand", "material", "color_name", "color_hex", "remaining_weight"])
+        if active_only:
+            spools = spools[spools["remaining_weight"] > 0]
+        spools = spools.assign(
+            swatch=[color_swatch(color_hex) for color_hex in spools["color_hex"]],
+            spool=spools["brand"] + " " + spools["material"],
+            grams=0.0
+        ).set_index("id")
+
+        # Bumped after each logged print so the editor starts again from zeros
+        if 'manual_entry_run' not in st.session_state:
+            st.session_state.manual_entry_run = 0
 
         with st.form("bulk_manual_entry"):
             job_name = st.text_input("Job Name", value="Manual Print")
             success = st.checkbox("Success", value=True)
-            
-            st.divider()
-            
-            usage_inputs = {}
-
-            for f in filaments:
-                # Visual Color Box Logic
-                color_hex = f.get('color_hex', '#000000')
-                if "," in color_hex:
-                    colors = color_hex.split(",")
-                    bg_style = f"background: linear-gradient(45deg, {colors[0]} 50%, {colors[1]} 50%);"
-                else:
-                    bg_style = f"background-color: {color_hex};"
-                
-                c_viz, c_info, c_input = st.columns([1, 6, 3])
-                
-                with c_viz:
-                    st.markdown(
-                        f'<div style="{bg_style} width: 100%; height: 35px; border-radius: 5px; border: 1px solid #ccc;"></div>',
-                        unsafe_allow_html=True
-                    )
-                
-                with c_info:
-                    st.write(f"**{f['brand']} {f['material']}**")
-                    st.caption(f"{f['color_name']} (ID:{f['id']})")
-                
-                with c_input:
-                    # Input for grams, default 0.0
-                    val = st.number_input(
-                        "Grams", 
-                        min_value=0.0, 
-                        step=1.0, 
-                        key=f"bulk_w_{f['id']}", 
-                        label_visibility="collapsed"
-                    )
-                    if val > 0:
-                        usage_inputs[f['id']] = val
-                
-                st.divider()
-            
+
+            # One table for all spools; edits stay in the browser until the form is submitted
+            edited = st.data_editor(
+                spools[["swatch", "spool", "color_name", "remaining_weight", "grams"]],
+                column_config={
+                    "swatch": st.column_config.ImageColumn("", width="small"),
+                    "spool": "Spool",
+                    "color_name": "Color",
+                    "remaining_weight": st.column_config.NumberColumn("Left (g)", format="%.0f"),
+                    "grams": st.column_config.NumberColumn("Grams", min_value=0.0, step=1.0, format="%.1f"),
+                },
+                disabled=["swatch", "spool", "color_name", "remaining_weight"],
+                width="stretch",
+                key=f"manual_entry_{st.session_state.manual_entry_run}"
+            )
+
             submit = st.form_submit_button("Log All Usage", type="primary")
-            
+
             if submit:
-                if not usage_inputs:
+                used = edited["grams"].fillna(0)
+                used = used[used > 0]
+                if used.empty:
                     st.warning("No usage entered. Please enter grams for at least one filament.")
                 else:
-                    usage_payload = [
-                        {"filament_id": fid, "grams_used": weight}
-                        for fid, weight in usage_inputs.items()
-                    ]
-                    
                     payload = {
                         "name": job_name,
                         "success": success,
-                        "filaments_used": usage_payload
+                        "filaments_used": [
+                            {"filament_id": int(fid), "grams_used": float(weight)}
+                            for fid, weight in used.items()
+                        ]
                     }
-                    
+
                     try:
-                        r = requests.post(f"{API_URL}/print", json=payload)
+                        r = api.log_print(payload)
                         if r.status_code == 200:
-                            st.success(f"Logged print! Deducted from {len(usage_inputs)} spools.")
-                            st.cache_data.clear()
+                            st.success(f"Logged print! Deducted from {len(used)} spools.")
+                            st.session_state.manual_entry_run += 1
                         else:
                             st.error(f"Error: {r.text}")
                     except Exception as e:
@@ -722,7 +768,7 @@ elif page == "Log Print":
 elif page == "Stats":
     st.header("📊 Statistics")
     try:
-        res = requests.get(f"{API_URL}/stats")
+        res = api.get_stats()
         if res.status_code == 200:
             data = res.json()
             c1, c2 = st.columns(2)
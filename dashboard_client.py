@@ -0,0 +1,115 @@
+"""
+HTTP client for the dashboard's calls to the backend API.
+
+One ApiClient is shared by every dashboard session and rerun (see get_api in
+dashboard.py), so its pooled requests.Session keeps connections to the API open
+instead of reconnecting on each call. Every request has a connect and read timeout,
+so a slow backend fails the call rather than hanging the page. Connection errors
+are retried with exponential backoff, and so are 502/503/504 responses to
+idempotent requests. Responses are gzip compressed by the API and decoded here.
+"""
+import json
+import os
+from typing import Dict, Iterable, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return float(value)
+
+API_URL = os.environ.get("FILAMENT_API_URL", "http://localhost:8000")
+CONNECT_TIMEOUT_S = _env_float("FILAMENT_API_CONNECT_TIMEOUT_S", 3)
+READ_TIMEOUT_S = _env_float("FILAMENT_API_READ_TIMEOUT_S", 15)
+# Parsing a large print file can take much longer than a regular call
+UPLOAD_READ_TIMEOUT_S = _env_float("FILAMENT_API_UPLOAD_TIMEOUT_S", 300)
+RETRIES = int(_env_float("FILAMENT_API_RETRIES", 3))
+RETRY_BACKOFF_S = _env_float("FILAMENT_API_RETRY_BACKOFF_S", 0.3)
+# Open connections kept per host; Streamlit runs each session's script on its own thread
+POOL_SIZE = int(_env_float("FILAMENT_API_POOL_SIZE", 20))
+
+# Errors that mean the API could not be reached or did not answer in time
+API_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+class ApiClient:
+    def __init__(
+        self,
+        base_url: str = API_URL,
+        connect_timeout: float = CONNECT_TIMEOUT_S,
+        read_timeout: float = READ_TIMEOUT_S,
+        retries: int = RETRIES,
+        backoff: float = RETRY_BACKOFF_S,
+        pool_size: int = POOL_SIZE
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # POST is not in Retry's allowed methods, so a print is never logged twice;
+        # connection errors are still retried since the request was never sent
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, path: str, read_timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        return self.session.request(method, self.base_url + path, timeout=timeout, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    # Filaments
+    def list_filaments(self, params: Iterable[Tuple[str, object]] = ()) -> requests.Response:
+        return self.request("GET", "/filaments", params=list(params))
+
+    def search_filaments(self, q: str, limit: int) -> requests.Response:
+        return self.request("GET", "/filaments/search", params={"q": q, "limit": limit})
+
+    def get_changes(self, since: int) -> requests.Response:
+        return self.request("GET", "/changes", params={"since": since})
+
+    def create_filament(self, payload: dict) -> requests.Response:
+        return self.request("POST", "/filament", json=payload)
+
+    def update_filament(self, filament_id: int, payload: dict) -> requests.Response:
+        return self.request("PUT", f"/filament/{filament_id}", json=payload)
+
+    # Prints
+    def log_print(self, payload: dict) -> requests.Response:
+        return self.request("POST", "/print", json=payload)
+
+    def log_print_from_file(
+        self,
+        filename: str,
+        content: bytes,
+        name: Optional[str] = None,
+        success: bool = True,
+        slots: Optional[Dict[int, int]] = None,
+        dry_run: bool = False
+    ) -> requests.Response:
+        """Logs a print from its file; `slots` maps 1-based slots to spool ids, the rest are matched by the API."""
+        files = {"file": (filename, content, "application/octet-stream")}
+        data = {"success": str(success).lower()}
+        if name:
+            data["name"] = name
+        if slots:
+            data["slots"] = json.dumps(slots)
+        return self.request(
+            "POST", "/print/from-file", read_timeout=UPLOAD_READ_TIMEOUT_S,
+            params={"dry_run": "true"} if dry_run else None, files=files, data=data
+        )
+
+    # Stats
+    def get_stats(self) -> requests.Response:
+        return self.request("GET", "/stats")
@@ -0,0 +1,6 @@
+from app import migrations
+
+
+def test_hot_queries_use_their_indexes():
+    # Runs every PLAN_CHECKS query against a fresh in-memory database
+    assert migrations.check_plans()